@@ -1,18 +1,16 @@
 import streamlit as st
 import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
-from datetime import datetime
 import time
-from io import BytesIO
-import unicodedata
-import pytz
-import random
-import string
-import re
-from urllib.parse import urlparse
+
+from erp.utils import auto_capitalize, extract_domain, format_vnd, generate_project_code, get_vn_time
+from erp.receipts import get_receipt_thumbnails, store_receipt
+from erp.data import (add_transaction, archive_closed_years, clear_data_cache, compact_all_sheets, current_row_generation,
+                      delete_material_row, delete_transaction, get_archived_years, get_ledger_checkpoint, load_config,
+                      load_data_with_index, load_materials_master, load_project_data, load_project_rows, load_project_totals,
+                      save_project_material, update_config_values, update_master_material, update_material_row, update_password,
+                      update_transaction)
+from erp.reports import (build_report, convert_df_to_excel_custom, export_project_materials_excel, generate_full_backup,
+                         summarize_project_materials)
 
 # ==============================================================================
 # 1. CẤU HÌNH & CSS 
@@ -49,350 +47,7 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# ==================== 2. KẾT NỐI API & HELPER ====================
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-
-@st.cache_resource(show_spinner=False)
-def get_creds(): return Credentials.from_service_account_info(st.secrets["gcp_service_account"], scopes=SCOPES)
-
-@st.cache_resource(show_spinner=False)
-def get_gs_client(): return gspread.authorize(get_creds())
-
-def get_vn_time(): return datetime.now(pytz.timezone('Asia/Ho_Chi_Minh'))
-def remove_accents(input_str):
-    if not isinstance(input_str, str): return str(input_str)
-    s = unicodedata.normalize('NFD', input_str)
-    return "".join([c for c in s if unicodedata.category(c) != 'Mn']).replace("đ", "d").replace("Đ", "D")
-
-def auto_capitalize(text):
-    if not text or not str(text).strip(): return ""
-    text = str(text).strip()
-    if text.lower().startswith(("http", "www")): return text
-    return text[0].upper() + text[1:]
-
-def format_vnd(amount):
-    if pd.isna(amount): return "0"
-    try:
-        val = float(amount)
-        if val.is_integer(): return "{:,.0f}".format(val).replace(",", ".")
-        return "{:,.2f}".format(val).replace(",", "X").replace(".", ",").replace("X", ".").rstrip('0').rstrip(',')
-    except: return "0"
-
-def generate_project_code(name): return f"{''.join([w[0] for w in remove_accents(name).upper().split() if w.isalnum()])}{get_vn_time().strftime('%d%m%y')}" if name else ""
-def generate_material_code(name): return f"VT{''.join([w[0] for w in remove_accents(name).upper().split() if w.isalnum()])[:3]}{''.join(random.choices(string.digits, k=3))}"
-
-def upload_image_to_drive(image_file, file_name):
-    try:
-        creds = get_creds(); service = build('drive', 'v3', credentials=creds); folder_id = st.secrets["DRIVE_FOLDER_ID"]
-        media = MediaIoBaseUpload(image_file, mimetype='image/jpeg')
-        file = service.files().create(body={'name': file_name, 'parents': [folder_id]}, media_body=media, fields='webViewLink').execute()
-        return file.get('webViewLink')
-    except: return ""
-
-def extract_domain(url):
-    url_str = str(url).strip()
-    if not url_str: return ""
-    if not url_str.lower().startswith(('http://', 'https://')):
-        if 'www.' in url_str.lower() or ('.' in url_str and '/' in url_str):
-            url_str = 'https://' + url_str
-        else:
-            return url_str 
-    try:
-        domain = urlparse(url_str).netloc
-        return domain.replace('www.', '') if domain else url_str
-    except:
-        return url_str
-
-def clean_note_and_link(note, link):
-    n = str(note).strip()
-    l = str(link).strip()
-    urls_in_note = re.findall(r'(https?://\S+|www\.\S+)', n, flags=re.IGNORECASE)
-    
-    if urls_in_note:
-        first_url = urls_in_note[0]
-        if not l:  
-            l = first_url
-            n = n.replace(first_url, '').strip()
-        elif first_url in l or l in first_url: 
-            n = n.replace(first_url, '').strip()
-            
-    n = re.sub(r'^[\s,\-\|]+|[\s,\-\|]+$', '', n)
-    return auto_capitalize(n), l
-
-# ==================== 3. DATA LAYER ====================
-def clear_data_cache(): st.cache_data.clear()
-
-@st.cache_data(ttl=60, show_spinner=False)
-def load_config():
-    client = get_gs_client(); wb = client.open("QuanLyThuChi")
-    try: sheet = wb.worksheet("config")
-    except:
-        sheet = wb.add_worksheet("config", 100, 2)
-        sheet.append_rows([["Key", "Value"], ["admin_pwd", "admin123"], ["viewer_pwd", "xem123"]])
-    config = {row['Key']: str(row['Value']) for row in sheet.get_all_records()}
-    if 'admin_pwd' not in config: config['admin_pwd'] = "admin123"
-    if 'viewer_pwd' not in config: config['viewer_pwd'] = "xem123"
-    if 'debt_1_name' not in config: config['debt_1_name'] = "SAMSUNG S1 HN"
-    if 'debt_1_val' not in config: config['debt_1_val'] = "-4000000"
-    if 'debt_2_name' not in config: config['debt_2_name'] = "TẾT 2025"
-    if 'debt_2_val' not in config: config['debt_2_val'] = "-5000000"
-    return config
-
-def update_config_value(key, value):
-    try:
-        client = get_gs_client(); sheet = client.open("QuanLyThuChi").worksheet("config")
-        cell = sheet.find(key)
-        if cell: sheet.update_cell(cell.row, 2, str(value))
-        else: sheet.append_row([key, str(value)])
-        clear_data_cache(); return True
-    except: return False
-
-@st.cache_data(ttl=300, show_spinner=False)
-def load_data_with_index():
-    try:
-        client = get_gs_client(); df = pd.DataFrame(client.open("QuanLyThuChi").worksheet("data").get_all_records())
-        if df.empty: return pd.DataFrame()
-        df['Row_Index'] = range(2, len(df) + 2)
-        df['Ngay'] = pd.to_datetime(df['Ngay'], dayfirst=True, errors='coerce')
-        df['SoTien'] = pd.to_numeric(df['SoTien'], errors='coerce').fillna(0).astype('float')
-        return df.dropna(subset=['Ngay'])
-    except: return pd.DataFrame()
-
-@st.cache_data(ttl=300, show_spinner=False)
-def load_materials_master():
-    try:
-        client = get_gs_client(); df = pd.DataFrame(client.open("QuanLyThuChi").worksheet("dm_vattu").get_all_records())
-        if 'TenVT' not in df.columns: return pd.DataFrame(columns=["MaVT", "TenVT", "DVT_Cap1", "DVT_Cap2", "QuyDoi", "DonGia_Cap1"])
-        df['Row_Index'] = range(2, len(df) + 2)
-        return df
-    except: return pd.DataFrame(columns=["MaVT", "TenVT", "DVT_Cap1", "DVT_Cap2", "QuyDoi", "DonGia_Cap1"])
-
-@st.cache_data(ttl=300, show_spinner=False)
-def load_project_data():
-    try:
-        client = get_gs_client(); df = pd.DataFrame(client.open("QuanLyThuChi").worksheet("data_duan").get_all_records())
-        if df.empty: return pd.DataFrame(columns=["MaDuAn", "TenDuAn", "NgayNhap", "MaVT", "TenVT", "DVT", "SoLuong", "DonGia", "ThanhTien", "GhiChu", "LinkNCC"])
-        for col in ['SoLuong', 'DonGia', 'ThanhTien']: df[col] = pd.to_numeric(df.get(col, 0), errors='coerce').fillna(0)
-        if 'LinkNCC' not in df.columns: df['LinkNCC'] = ""
-        df['Row_Index'] = range(2, len(df) + 2)
-        return df
-    except: return pd.DataFrame()
-
-# --- WRITE FUNCTIONS & HOTFIXES ---
-def update_password(role, new_pwd):
-    key = 'admin_pwd' if role == 'admin' else 'viewer_pwd'
-    update_config_value(key, new_pwd)
-    clear_data_cache()
-
-def add_transaction(date, category, amount, description, image_link):
-    client = get_gs_client(); client.open("QuanLyThuChi").worksheet("data").append_row([date.strftime('%Y-%m-%d'), category, amount, auto_capitalize(description), image_link])
-    clear_data_cache()
-
-def update_transaction(row_idx, date, category, amount, description, image_link):
-    sheet = get_gs_client().open("QuanLyThuChi").worksheet("data")
-    sheet.update_cell(int(row_idx), 1, date.strftime('%Y-%m-%d'))
-    sheet.update_cell(int(row_idx), 2, category)
-    sheet.update_cell(int(row_idx), 3, amount)
-    sheet.update_cell(int(row_idx), 4, auto_capitalize(description))
-    if image_link: sheet.update_cell(int(row_idx), 5, image_link)
-    clear_data_cache()
-
-def delete_transaction(sheet_name, row_idx):
-    get_gs_client().open("QuanLyThuChi").worksheet(sheet_name).delete_rows(int(row_idx)); clear_data_cache()
-
-def delete_material_row(row_idx):
-    delete_transaction("data_duan", row_idx)
-
-def save_project_material(proj_code, proj_name, mat_name, unit1, unit2, ratio, user_input_price, selected_unit, qty, note, link_ncc, is_new_item=False):
-    wb = get_gs_client().open("QuanLyThuChi")
-    mat_code = ""
-    proj_name = auto_capitalize(proj_name); mat_name = auto_capitalize(mat_name)
-    final_price = float(user_input_price)
-    thanh_tien = float(qty) * final_price
-    final_note, final_link = clean_note_and_link(note, link_ncc)
-    
-    if is_new_item:
-        try: ws_master = wb.worksheet("dm_vattu")
-        except: ws_master = wb.add_worksheet("dm_vattu", 1000, 6); ws_master.append_row(["MaVT", "TenVT", "DVT_Cap1", "DVT_Cap2", "QuyDoi", "DonGia_Cap1"])
-        mat_code = generate_material_code(mat_name)
-        master_price = final_price if selected_unit == unit1 else final_price * float(ratio)
-        ws_master.append_row([mat_code, mat_name, auto_capitalize(unit1), auto_capitalize(unit2), ratio, master_price])
-    else:
-        df_master = load_materials_master()
-        if not df_master.empty:
-            found = df_master[df_master['TenVT'] == mat_name]
-            if not found.empty: mat_code = found.iloc[0]['MaVT']
-    
-    try: ws_data = wb.worksheet("data_duan")
-    except: ws_data = wb.add_worksheet("data_duan", 1000, 11); ws_data.append_row(["MaDuAn", "TenDuAn", "NgayNhap", "MaVT", "TenVT", "DVT", "SoLuong", "DonGia", "ThanhTien", "GhiChu", "LinkNCC"])
-    
-    if ws_data.col_count < 11: ws_data.add_cols(11 - ws_data.col_count)
-    headers = ws_data.row_values(1)
-    if len(headers) < 11: ws_data.update_cell(1, 11, "LinkNCC")
-    
-    row_data = [proj_code, proj_name, get_vn_time().strftime('%Y-%m-%d %H:%M:%S'), mat_code, mat_name, selected_unit, qty, final_price, thanh_tien, final_note, final_link]
-    ws_data.append_row(row_data)
-    clear_data_cache()
-
-def update_material_row(row_idx, qty, price, note, link_ncc):
-    final_note, final_link = clean_note_and_link(note, link_ncc)
-    sheet = get_gs_client().open("QuanLyThuChi").worksheet("data_duan")
-    
-    if sheet.col_count < 11:
-        sheet.add_cols(11 - sheet.col_count)
-        sheet.update_cell(1, 11, "LinkNCC")
-        
-    sheet.update_cell(int(row_idx), 7, qty)
-    sheet.update_cell(int(row_idx), 8, price)
-    sheet.update_cell(int(row_idx), 9, float(qty) * float(price))
-    sheet.update_cell(int(row_idx), 10, final_note)
-    sheet.update_cell(int(row_idx), 11, final_link)
-    clear_data_cache()
-
-def update_master_material(row_idx, name, u1, u2, ratio, price):
-    sheet = get_gs_client().open("QuanLyThuChi").worksheet("dm_vattu")
-    sheet.update_cell(int(row_idx), 2, auto_capitalize(name))
-    sheet.update_cell(int(row_idx), 3, auto_capitalize(u1))
-    sheet.update_cell(int(row_idx), 4, auto_capitalize(u2))
-    sheet.update_cell(int(row_idx), 5, ratio)
-    sheet.update_cell(int(row_idx), 6, price)
-    clear_data_cache()
-
-# ==================== 4. EXCEL & BACKUP ====================
-def generate_full_backup():
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        load_data_with_index().to_excel(writer, sheet_name='ThuChi', index=False)
-        load_project_data().to_excel(writer, sheet_name='DuAn_ChiTiet', index=False)
-        load_materials_master().to_excel(writer, sheet_name='KhoVatTu', index=False)
-    return output.getvalue()
-
-def convert_df_to_excel_custom(df_report, start_date, end_date):
-    output = BytesIO()
-    cfg = load_config()
-    d1_n = cfg.get('debt_1_name', "SAMSUNG S1 HN"); d1_v = float(cfg.get('debt_1_val', -4000000))
-    d2_n = cfg.get('debt_2_name', "TẾT 2025"); d2_v = float(cfg.get('debt_2_val', -5000000))
-
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        wb = writer.book
-        fn = 'Times New Roman'
-        f_title = wb.add_format({'bold': True, 'font_size': 20, 'align': 'center', 'valign': 'vcenter', 'font_name': fn})
-        f_sub = wb.add_format({'font_size': 12, 'align': 'center', 'valign': 'vcenter', 'italic': True, 'font_name': fn})
-        f_sys = wb.add_format({'bold': True, 'font_size': 12, 'align': 'center', 'valign': 'vcenter', 'font_name': fn, 'font_color': '#1e3a8a'})
-        f_head = wb.add_format({'bold': True, 'border': 1, 'align': 'center', 'bg_color': '#D3D3D3', 'font_size': 11, 'font_name': fn})
-        f_cell = wb.add_format({'border': 1, 'valign': 'vcenter', 'font_size': 11, 'font_name': fn})
-        f_num = wb.add_format({'border': 1, 'valign': 'vcenter', 'num_format': '#,##0', 'font_size': 11, 'font_name': fn})
-        f_tot_l = wb.add_format({'bold': True, 'border': 1, 'bg_color': '#FFFF00', 'align': 'center', 'font_size': 12, 'font_name': fn})
-        f_tot_v = wb.add_format({'bold': True, 'border': 1, 'bg_color': '#FFCC00', 'num_format': '#,##0', 'font_size': 12, 'font_name': fn})
-        f_debt_t = wb.add_format({'font_size': 11, 'italic': True, 'align': 'right', 'font_name': fn})
-        f_debt_n = wb.add_format({'font_size': 11, 'italic': True, 'align': 'right', 'font_name': fn, 'num_format': '#,##0', 'font_color': 'red', 'bold': True})
-
-        ws = wb.add_worksheet("SoQuy")
-        ws.merge_range('A1:F1', "QUYẾT TOÁN", f_title)
-        ws.merge_range('A2:F2', f"Từ {start_date.strftime('%d/%m/%Y')} đến {end_date.strftime('%d/%m/%Y')}", f_sub)
-        ws.merge_range('A3:F3', f"Xuất lúc: {get_vn_time().strftime('%H:%M %d/%m/%Y')}", f_sub)
-        ws.merge_range('A4:F4', "HỆ THỐNG QUYẾT TOÁN", f_sys)
-        ws.merge_range('A5:F5', "Người tạo: TUẤN VDS.HCM", f_sub)
-        
-        for c, h in enumerate(["STT", "Khoản", "Ngày chi", "Ngày Nhận", "Số tiền", "Còn lại"]): ws.write(5, c, h, f_head)
-        ws.set_column('B:B', 40); ws.set_column('C:D', 15); ws.set_column('E:F', 18)
-
-        df_c = df_report.reset_index(drop=True)
-        for i, r in df_c.iterrows():
-            ws.write(6+i, 0, r['STT'], f_cell); ws.write(6+i, 1, r['Khoan'], f_cell)
-            ws.write(6+i, 2, r['NgayChi'], f_cell); ws.write(6+i, 3, r['NgayNhan'], f_cell)
-            ws.write(6+i, 4, r['SoTienShow'] if r['Loai']!='Open' else "", f_num); ws.write(6+i, 5, r['ConLai'], f_num)
-            
-        lr = 6 + len(df_c)
-        ws.merge_range(lr, 0, lr, 4, "TỔNG CỘNG", f_tot_l)
-        lb = df_c.iloc[-1]['ConLai'] if not df_c.empty else 0
-        ws.write(lr, 5, lb, f_tot_v)
-        
-        fr = lr + 3 
-        ws.merge_range(fr, 3, fr, 4, d1_n, f_debt_t); ws.write(fr, 5, d1_v, f_debt_n); fr+=1
-        ws.merge_range(fr, 3, fr, 4, d2_n, f_debt_t); ws.write(fr, 5, d2_v, f_debt_n); fr+=1
-        ws.merge_range(fr, 0, fr, 4, "TỔNG TẠM TÍNH", f_tot_l); ws.write(fr, 5, lb + d1_v + d2_v, f_tot_v)
-    return output.getvalue()
-
-def export_project_materials_excel(df_proj, proj_name):
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        wb = writer.book
-        fn = 'Times New Roman'
-        f_title = wb.add_format({'bold': True, 'font_size': 20, 'align': 'center', 'valign': 'vcenter', 'font_name': fn})
-        f_sub = wb.add_format({'font_size': 12, 'align': 'center', 'valign': 'vcenter', 'italic': True, 'font_name': fn})
-        f_sys = wb.add_format({'bold': True, 'font_size': 12, 'align': 'center', 'valign': 'vcenter', 'font_name': fn, 'font_color': '#1e3a8a'})
-        f_head = wb.add_format({'bold': True, 'border': 1, 'align': 'center', 'bg_color': '#D3D3D3', 'font_size': 11, 'font_name': fn})
-        f_cell = wb.add_format({'border': 1, 'valign': 'vcenter', 'font_size': 11, 'font_name': fn})
-        f_num = wb.add_format({'border': 1, 'valign': 'vcenter', 'num_format': '#,##0', 'font_size': 11, 'font_name': fn})
-        f_tot_l = wb.add_format({'bold': True, 'border': 1, 'bg_color': '#FFFF00', 'align': 'center', 'font_size': 12, 'font_name': fn})
-        f_tot_v = wb.add_format({'bold': True, 'border': 1, 'bg_color': '#FFCC00', 'num_format': '#,##0', 'valign': 'vcenter', 'font_name': fn, 'font_size': 12})
-        f_link = wb.add_format({'border': 1, 'valign': 'vcenter', 'font_size': 11, 'font_name': fn, 'font_color': 'blue', 'underline': True})
-        
-        ws = wb.add_worksheet("BangKe")
-        
-        ws.merge_range('A1:I1', "BẢNG KÊ VẬT TƯ", f_title)
-        ws.merge_range('A2:I2', f"Dự án: {proj_name}", f_sub)
-        ws.merge_range('A3:I3', f"Xuất lúc: {get_vn_time().strftime('%H:%M %d/%m/%Y')}", f_sub)
-        ws.merge_range('A4:I4', "HỆ THỐNG QUẢN LÝ VẬT TƯ DỰ ÁN", f_sys)
-        ws.merge_range('A5:I5', "Người tạo: TUẤN VDS.HCM", f_sub)
-        
-        cols = ["STT", "Mã VT", "Tên VT", "ĐVT", "SL", "Đơn giá", "Thành tiền", "Ghi chú", "Link/NCC"]
-        for i, h in enumerate(cols): ws.write(5, i, h, f_head)
-        ws.set_column('B:B', 15); ws.set_column('C:C', 40); ws.set_column('E:G', 15); ws.set_column('H:I', 25)
-        
-        df_c = df_proj.reset_index(drop=True)
-        tot = 0
-        for i, r in df_c.iterrows():
-            ws.write(6+i, 0, i+1, f_cell)
-            ws.write(6+i, 1, str(r.get('MaVT', '')), f_cell)
-            ws.write(6+i, 2, str(r.get('TenVT', '')), f_cell)
-            ws.write(6+i, 3, str(r.get('DVT', '')), f_cell)
-            ws.write(6+i, 4, r.get('SoLuong', 0), f_cell)
-            ws.write(6+i, 5, r.get('DonGia', 0), f_num)
-            ws.write(6+i, 6, r.get('ThanhTien', 0), f_num)
-            ws.write(6+i, 7, str(r.get('GhiChu', '')), f_cell)
-            
-            link_val = str(r.get('LinkNCC', '')).strip()
-            domain = extract_domain(link_val)
-            is_url = link_val.lower().startswith(('http', 'www')) or (domain != link_val and '.' in domain)
-            
-            if is_url:
-                href = link_val if link_val.lower().startswith('http') else 'https://' + link_val
-                ws.write_url(6+i, 8, href, f_link, string=domain)
-            else:
-                ws.write(6+i, 8, link_val, f_cell)
-                
-            tot += r.get('ThanhTien', 0)
-            
-        lr = 6 + len(df_c)
-        ws.merge_range(lr, 0, lr, 5, "TỔNG CỘNG", f_tot_l)
-        ws.write(lr, 6, tot, f_tot_v)
-        ws.write(lr, 7, "", f_tot_l)
-        ws.write(lr, 8, "", f_tot_l)
-    return output.getvalue()
-
-def process_report_data(df, start_date=None, end_date=None):
-    if df.empty: return pd.DataFrame()
-    df_all = df.sort_values(by=['Ngay', 'Row_Index']).copy()
-    df_all['SignedAmount'] = df_all.apply(lambda x: x['SoTien'] if x['Loai'] == 'Thu' else -x['SoTien'], axis=1)
-    df_all['ConLai'] = df_all['SignedAmount'].cumsum()
-    if start_date and end_date:
-        mask_before = df_all['Ngay'].dt.date < start_date
-        ob = df_all[mask_before].iloc[-1]['ConLai'] if not df_all[mask_before].empty else 0
-        df_proc = df_all[(df_all['Ngay'].dt.date >= start_date) & (df_all['Ngay'].dt.date <= end_date)].copy()
-        if not df_proc.empty: df_proc['ConLai'] = ob + df_proc['SignedAmount'].cumsum()
-        df_proc = pd.concat([pd.DataFrame([{'Row_Index': 0, 'Ngay': pd.Timestamp(start_date), 'Loai': 'Open', 'SoTien': 0, 'MoTa': "Số dư đầu kỳ", 'HinhAnh': '', 'ConLai': ob, 'SignedAmount': 0}]), df_proc], ignore_index=True)
-    else: df_proc = df_all.copy()
-    if df_proc.empty: return pd.DataFrame()
-    df_proc['STT'] = range(1, len(df_proc) + 1)
-    df_proc['Khoan'] = df_proc.apply(lambda x: x['MoTa'] if x['Loai'] == 'Open' else auto_capitalize(x['MoTa']), axis=1)
-    def get_date_str(row): return "" if row['Loai'] == 'Open' or pd.isna(row['Ngay']) else row['Ngay'].strftime('%d/%m/%Y')
-    df_proc['NgayChi'] = df_proc.apply(lambda x: get_date_str(x) if x['Loai'] == 'Chi' else "", axis=1)
-    df_proc['NgayNhan'] = df_proc.apply(lambda x: get_date_str(x) if x['Loai'] == 'Thu' else "", axis=1)
-    df_proc['SoTienShow'] = df_proc.apply(lambda x: x['SoTien'] if x['Loai'] != 'Open' else 0, axis=1)
-    return df_proc[['STT', 'Khoan', 'NgayChi', 'NgayNhan', 'SoTienShow', 'ConLai', 'Loai']]
-
+# ==================== 2. UI HELPER ====================
 def render_pagination(total_items, items_per_page, key_prefix):
     total_pages = max(1, (total_items - 1) // items_per_page + 1)
     if total_pages <= 1: return 1
@@ -401,6 +56,24 @@ def render_pagination(total_items, items_per_page, key_prefix):
     with c3: page = st.number_input("Trang", min_value=1, max_value=total_pages, value=1, label_visibility="collapsed", key=f"page_{key_prefix}")
     return page
 
+def rerun_after_row_write(ok):
+    """Ghi theo Row_Index bị từ chối (dữ liệu vừa được dọn / khóa sổ) thì báo để thao tác lại, không thì tải lại trang."""
+    if ok: st.rerun()
+    st.warning("⚠️ Dữ liệu vừa thay đổi, đã tải lại. Vui lòng thao tác lại!")
+
+def start_edit(key, row_idx):
+    """Mở form sửa: lưu Row_Index kèm mốc row_gen lúc bấm ✏️, hàm ghi dùng mốc này để từ chối nếu dòng đã bị dịch."""
+    st.session_state[key] = row_idx; st.session_state[f"{key}_gen"] = current_row_generation(); st.rerun()
+
+def get_edit_row(key, frame):
+    """Dòng đang sửa; dòng đã bị xóa ở phiên khác hoặc Row_Index đã bị dịch (dọn / khóa sổ) thì thoát chế độ sửa."""
+    row_idx = st.session_state.get(key)
+    if row_idx is None: return None
+    found = frame[frame['Row_Index'] == row_idx] if 'Row_Index' in frame.columns else frame.iloc[0:0]
+    if not found.empty and st.session_state.get(f"{key}_gen") == current_row_generation(): return found.iloc[0]
+    st.session_state[key] = None; st.warning("⚠️ Dòng đang sửa vừa bị xóa hoặc thay đổi, vui lòng chọn lại!")
+    return None
+
 # ==================== AUTHENTICATION & LOGIN UI ====================
 def check_password():
     if 'role' not in st.session_state: st.session_state.role = None
@@ -424,14 +97,16 @@ def change_password_ui():
     with st.form("cp"):
         n = st.text_input("Mật khẩu mới:", type="password")
         if st.form_submit_button("Đổi mật khẩu"):
-            update_password(st.session_state.role, n); st.success("Xong!")
+            if update_password(st.session_state.role, n): st.success("Xong!")
+            else: st.error("Lỗi ghi dữ liệu, vui lòng thử lại!")
 
 # --- THU CHI UI ---
 def render_thuchi_module(is_laptop):
     st.markdown("<div class='system-title'>HỆ THỐNG QUYẾT TOÁN</div>", unsafe_allow_html=True)
     df = load_data_with_index()
-    t_thu = df[df['Loai']=='Thu']['SoTien'].sum() if not df.empty else 0
-    t_chi = df[df['Loai']=='Chi']['SoTien'].sum() if not df.empty else 0
+    _, cp_thu, cp_chi = get_ledger_checkpoint()
+    t_thu = cp_thu + (df[df['Loai']=='Thu']['SoTien'].sum() if not df.empty else 0)
+    t_chi = cp_chi + (df[df['Loai']=='Chi']['SoTien'].sum() if not df.empty else 0)
     bal = t_thu - t_chi
     st.markdown(f"<div class='balance-box'><div class='bal-title'>SỐ DƯ HIỆN TẠI</div><div class='bal-val {'bal-neg' if bal<0 else ''}'>{format_vnd(bal)}</div><div style='display:flex; justify-content:space-between; margin-top:15px; border-top:1px dashed rgba(128,128,128,0.3); padding-top:10px;'><div style='color:#22c55e; font-weight:700'>⬇️ {format_vnd(t_thu)}</div><div style='color:#ef4444; font-weight:700'>⬆️ {format_vnd(t_chi)}</div></div></div>", unsafe_allow_html=True)
 
@@ -440,10 +115,9 @@ def render_thuchi_module(is_laptop):
     def render_input_tc():
         if st.session_state.role != 'admin': return
         d_d = get_vn_time(); d_t = "Chi"; d_a = None; d_desc = ""
-        is_edit = st.session_state.edit_tc_id is not None
-        if is_edit and not df.empty:
-            r = df[df['Row_Index'] == st.session_state.edit_tc_id]
-            if not r.empty: d_d, d_t, d_a, d_desc = r.iloc[0]['Ngay'], r.iloc[0]['Loai'], float(r.iloc[0]['SoTien']), r.iloc[0]['MoTa']; st.info(f"✏️ Sửa: {d_desc}")
+        r = get_edit_row("edit_tc_id", df)
+        is_edit = r is not None
+        if is_edit: d_d, d_t, d_a, d_desc = r['Ngay'], r['Loai'], float(r['SoTien']), r['MoTa']; st.info(f"✏️ Sửa: {d_desc}")
 
         with st.form("tc_form", clear_on_submit=not is_edit):
             c1, c2 = st.columns(2)
@@ -465,10 +139,11 @@ def render_thuchi_module(is_laptop):
             if st.form_submit_button("CẬP NHẬT" if is_edit else "LƯU GIAO DỊCH"):
                 if (d_amt is not None and d_amt > 0) and final_desc:
                     if is_edit:
-                        update_transaction(st.session_state.edit_tc_id, d_date, d_type, d_amt, final_desc, "")
-                        st.session_state.edit_tc_id = None; st.success("Đã sửa!"); time.sleep(0.5); st.rerun()
+                        ok = update_transaction(st.session_state.edit_tc_id, d_date, d_type, d_amt, final_desc, "", st.session_state.get("edit_tc_id_gen")); st.session_state.edit_tc_id = None
+                        if ok: st.success("Đã sửa!"); time.sleep(0.5)
+                        rerun_after_row_write(ok)
                     else:
-                        add_transaction(d_date, d_type, d_amt, final_desc, upload_image_to_drive(img, f"TC_{d_date}") if img else "")
+                        add_transaction(d_date, d_type, d_amt, final_desc, store_receipt(img, f"TC_{d_date}") if img else "")
                         st.success("Đã thêm!"); time.sleep(0.5); st.rerun()
                 else: st.warning("Nhập thiếu thông tin!")
         if is_edit and st.button("Hủy Sửa", use_container_width=True): st.session_state.edit_tc_id = None; st.rerun()
@@ -484,21 +159,26 @@ def render_thuchi_module(is_laptop):
                 d2_v = st.text_input("Giá trị 2:", value=cfg.get('debt_2_val', ''))
                 
                 if st.form_submit_button("LƯU CẤU HÌNH"):
-                    update_config_value('debt_1_name', d1_n); update_config_value('debt_1_val', d1_v)
-                    update_config_value('debt_2_name', d2_n); update_config_value('debt_2_val', d2_v)
-                    st.success("Đã lưu!"); time.sleep(0.5); st.rerun()
+                    if update_config_values({'debt_1_name': d1_n, 'debt_1_val': d1_v, 'debt_2_name': d2_n, 'debt_2_val': d2_v}):
+                        st.success("Đã lưu!"); time.sleep(0.5); st.rerun()
+                    else: st.error("Lỗi ghi dữ liệu, vui lòng thử lại!")
 
     def _render_tc_items(data_frame):
+        thumbs = get_receipt_thumbnails(data_frame['HinhAnh'].fillna("").tolist()) if 'HinhAnh' in data_frame.columns else {}
         for i, r in data_frame.iterrows():
             c1, c2, c3, c4 = st.columns([1.5, 4.5, 2.5, 1.5])
             c1.markdown(f"<span class='cell-sub'>{r['Ngay'].strftime('%d/%m')}</span>", unsafe_allow_html=True)
-            c2.markdown(f"<div class='cell-main'>{r['MoTa']}</div>", unsafe_allow_html=True)
+            img_link = str(r.get('HinhAnh', '') or '').strip()
+            if img_link in thumbs: receipt = f"<a href='{img_link}' target='_blank'><img src='{thumbs[img_link]}' style='height:32px; border-radius:4px; margin-right:8px; vertical-align:middle;'></a>"
+            elif img_link: receipt = f"<a href='{img_link}' target='_blank' style='text-decoration:none; margin-right:8px;'>🧾</a>"
+            else: receipt = ""
+            c2.markdown(f"<div class='cell-main'>{receipt}{r['MoTa']}</div>", unsafe_allow_html=True)
             c3.markdown(f"<div class='{'money-inc' if r['Loai']=='Thu' else 'money-exp'}' style='text-align:right'>{format_vnd(r['SoTien'])}</div>", unsafe_allow_html=True)
             with c4:
                 if st.session_state.role == 'admin':
                     b1, b2 = st.columns(2)
-                    if b1.button("✏️", key=f"e_tc_{r['Row_Index']}"): st.session_state.edit_tc_id = r['Row_Index']; st.rerun()
-                    if b2.button("🗑️", key=f"d_tc_{r['Row_Index']}"): delete_transaction("data", r['Row_Index']); st.rerun()
+                    if b1.button("✏️", key=f"e_tc_{r['Row_Index']}"): start_edit("edit_tc_id", r['Row_Index'])
+                    if b2.button("🗑️", key=f"d_tc_{r['Row_Index']}"): rerun_after_row_write(delete_transaction("data", r['Row_Index']))
             st.markdown("<div style='border-bottom:1px solid rgba(128,128,128,0.1)'></div>", unsafe_allow_html=True)
 
     def render_list_tc():
@@ -514,10 +194,10 @@ def render_thuchi_module(is_laptop):
         else: _render_tc_items(df_paged)
 
     def render_export_tc():
-        if not df.empty:
+        if not df.empty or get_archived_years("data"):
             d1, d2 = st.date_input("Từ ngày", get_vn_time().replace(day=1), key="d1_tc"), st.date_input("Đến ngày", get_vn_time(), key="d2_tc")
             if st.button("TẢI EXCEL QUYẾT TOÁN"):
-                st.download_button("DOWNLOAD FILE", convert_df_to_excel_custom(process_report_data(df, d1, d2), d1, d2), f"Quyet_Toan_{get_vn_time().strftime('%d%m%Y')}.xlsx")
+                st.download_button("DOWNLOAD FILE", convert_df_to_excel_custom(build_report(d1, d2), d1, d2), f"Quyet_Toan_{get_vn_time().strftime('%d%m%Y')}.xlsx")
         else: st.warning("Không có dữ liệu")
 
     if is_laptop and st.session_state.role == 'admin':
@@ -526,7 +206,7 @@ def render_thuchi_module(is_laptop):
         with c2:
             t1, t2, t3 = st.tabs(["LỊCH SỬ", "BÁO CÁO", "XUẤT"])
             with t1: render_list_tc()
-            with t2: st.dataframe(process_report_data(df, st.date_input("Từ", get_vn_time().replace(day=1), key="d1_rp"), st.date_input("Đến", get_vn_time(), key="d2_rp")), use_container_width=True)
+            with t2: st.dataframe(build_report(st.date_input("Từ", get_vn_time().replace(day=1), key="d1_rp"), st.date_input("Đến", get_vn_time(), key="d2_rp")), use_container_width=True)
             with t3: render_export_tc()
     else:
         mt = st.tabs(["NHẬP", "LỊCH SỬ", "SỔ QUỸ", "XUẤT"]) if st.session_state.role == 'admin' else st.tabs(["LỊCH SỬ", "SỔ QUỸ", "XUẤT"])
@@ -535,13 +215,13 @@ def render_thuchi_module(is_laptop):
             with mt[0]: render_input_tc(); idx += 1
         with mt[idx]: render_list_tc()
         with mt[idx+1]: 
-            st.dataframe(process_report_data(df, st.date_input("Từ", get_vn_time().replace(day=1), key="m_d1"), st.date_input("Đến", get_vn_time(), key="m_d2")), use_container_width=True)
+            st.dataframe(build_report(st.date_input("Từ", get_vn_time().replace(day=1), key="m_d1"), st.date_input("Đến", get_vn_time(), key="m_d2")), use_container_width=True)
         with mt[idx+2]: render_export_tc()
 
 def render_vattu_module(is_laptop):
     st.markdown("<div class='system-title'>HỆ THỐNG QUẢN LÝ VẬT TƯ DỰ ÁN</div>", unsafe_allow_html=True)
-    df_pj, df_m = load_project_data(), load_materials_master()
-    p_opts = ["++ TẠO DỰ ÁN MỚI ++"] + list(reversed(df_pj['TenDuAn'].unique().tolist() if not df_pj.empty else []))
+    df_pj, df_m, df_tot = load_project_data(), load_materials_master(), load_project_totals()
+    p_opts = ["++ TẠO DỰ ÁN MỚI ++"] + list(reversed(df_tot['TenDuAn'].unique().tolist()))
     if 'curr_proj_name' not in st.session_state: st.session_state.curr_proj_name = ""
     curr_idx = p_opts.index(st.session_state.curr_proj_name) if st.session_state.curr_proj_name in p_opts else 0
 
@@ -599,7 +279,7 @@ def render_vattu_module(is_laptop):
                     
                     if st.form_submit_button("➕ THÊM VÀO DỰ ÁN"):
                         if qty is not None and qty > 0 and input_price is not None:
-                            pc = df_pj[df_pj['TenDuAn'] == st.session_state.curr_proj_name].iloc[0]['MaDuAn'] if sel_p != "++ TẠO DỰ ÁN MỚI ++" and not df_pj.empty else generate_project_code(st.session_state.curr_proj_name)
+                            pc = df_tot[df_tot['TenDuAn'] == st.session_state.curr_proj_name].iloc[0]['MaDuAn'] if sel_p != "++ TẠO DỰ ÁN MỚI ++" and not df_tot.empty else generate_project_code(st.session_state.curr_proj_name)
                             save_project_material(pc, st.session_state.curr_proj_name, vt_final, u1, u2, ratio, input_price, u_ch.split(" (")[0] if "(" in u_ch else u_ch, qty, note, link_ncc, is_new)
                             st.success("Đã thêm!"); time.sleep(0.5); st.rerun()
                         else:
@@ -639,23 +319,23 @@ def render_vattu_module(is_laptop):
             c3.markdown(f"<div class='money-inc' style='text-align:right;color:#333 !important;margin-top:8px;'>{format_vnd(r['ThanhTien'])}</div>", unsafe_allow_html=True)
             
             with c4:
-                if st.session_state.role == 'admin':
+                if st.session_state.role == 'admin' and pd.isna(r.get('LuuTru')):
                     b1, b2 = st.columns(2)
-                    if b1.button("✏️", key=f"evt_{r['Row_Index']}"): st.session_state.edit_vt_id = r['Row_Index']; st.rerun()
-                    if b2.button("🗑️", key=f"dvt_{r['Row_Index']}"): delete_material_row(r['Row_Index']); st.rerun()
+                    if b1.button("✏️", key=f"evt_{r['Row_Index']}"): start_edit("edit_vt_id", r['Row_Index'])
+                    if b2.button("🗑️", key=f"dvt_{r['Row_Index']}"): rerun_after_row_write(delete_material_row(r['Row_Index']))
             st.markdown("<div style='border-bottom:1px solid rgba(128,128,128,0.1)'></div>", unsafe_allow_html=True)
 
     def render_list_vt():
         vp = st.session_state.curr_proj_name if st.session_state.role == 'admin' else st.selectbox("Xem dự án:", p_opts, index=curr_idx)
-        if vp and vp != "++ TẠO DỰ ÁN MỚI ++" and not df_pj.empty:
-            dv = df_pj[df_pj['TenDuAn'] == vp]
+        if vp and vp != "++ TẠO DỰ ÁN MỚI ++" and not df_tot.empty:
+            dv = load_project_rows(vp)
             if st.session_state.role == 'admin': st.markdown(f"**Đang xem: {vp}**")
             st.markdown("""<div class="excel-header" style="display:flex"><div style="width:40%">TÊN VẬT TƯ</div><div style="width:15%">SL</div><div style="width:25%;text-align:right">TIỀN</div><div style="width:20%;text-align:center">...</div></div>""", unsafe_allow_html=True)
             
             if st.session_state.role == 'admin':
                 if 'edit_vt_id' not in st.session_state: st.session_state.edit_vt_id = None
-                if st.session_state.edit_vt_id:
-                    re = df_pj[df_pj['Row_Index'] == st.session_state.edit_vt_id].iloc[0]
+                re = get_edit_row("edit_vt_id", df_pj)
+                if re is not None:
                     with st.form("ed_vt"):
                         st.info(f"Sửa: {re['TenVT']}")
                         
@@ -671,8 +351,8 @@ def render_vattu_module(is_laptop):
                         col_b1, col_b2 = st.columns(2)
                         with col_b1:
                             if st.form_submit_button("CẬP NHẬT", use_container_width=True): 
-                                update_material_row(st.session_state.edit_vt_id, nq, np, nn, nl)
-                                st.session_state.edit_vt_id = None; st.rerun()
+                                ok = update_material_row(st.session_state.edit_vt_id, nq, np, nn, nl, st.session_state.get("edit_vt_id_gen"))
+                                st.session_state.edit_vt_id = None; rerun_after_row_write(ok)
                         with col_b2:
                             if st.form_submit_button("HỦY", use_container_width=True): 
                                 st.session_state.edit_vt_id = None; st.rerun()
@@ -695,16 +375,16 @@ def render_vattu_module(is_laptop):
             with c4:
                 if st.session_state.role == 'admin':
                     b1, b2 = st.columns(2)
-                    if b1.button("✏️", key=f"em_{r['Row_Index']}"): st.session_state.edit_m_id = r['Row_Index']; st.rerun()
-                    if b2.button("🗑️", key=f"dm_{r['Row_Index']}"): delete_transaction("dm_vattu", r['Row_Index']); st.rerun()
+                    if b1.button("✏️", key=f"em_{r['Row_Index']}"): start_edit("edit_m_id", r['Row_Index'])
+                    if b2.button("🗑️", key=f"dm_{r['Row_Index']}"): rerun_after_row_write(delete_transaction("dm_vattu", r['Row_Index']))
             st.markdown("<div style='border-bottom:1px solid rgba(128,128,128,0.1)'></div>", unsafe_allow_html=True)
 
     def render_master_data():
         if df_m.empty: st.info("Kho vật tư trống."); return
         
         if 'edit_m_id' not in st.session_state: st.session_state.edit_m_id = None
-        if st.session_state.edit_m_id and st.session_state.role == 'admin':
-            re = df_m[df_m['Row_Index'] == st.session_state.edit_m_id].iloc[0]
+        re = get_edit_row("edit_m_id", df_m) if st.session_state.role == 'admin' else None
+        if re is not None:
             with st.form("ed_master"):
                 st.info(f"✏️ Sửa Thông Tin Gốc: {re['TenVT']}")
                 n_name = st.text_input("Tên VT", re['TenVT'])
@@ -713,7 +393,7 @@ def render_vattu_module(is_laptop):
                 nrat = c3.number_input("Quy đổi", value=float(re.get('QuyDoi',1)))
                 npri = c4.number_input("Giá chuẩn", value=int(re.get('DonGia_Cap1',0)), step=1000, format="%d")
                 b1, b2 = st.columns(2)
-                if b1.form_submit_button("💾 LƯU KHO"): update_master_material(st.session_state.edit_m_id, n_name, nu1, nu2, nrat, npri); st.session_state.edit_m_id = None; st.rerun()
+                if b1.form_submit_button("💾 LƯU KHO"): ok = update_master_material(st.session_state.edit_m_id, n_name, nu1, nu2, nrat, npri, st.session_state.get("edit_m_id_gen")); st.session_state.edit_m_id = None; rerun_after_row_write(ok)
                 if b2.form_submit_button("❌ HỦY"): st.session_state.edit_m_id = None; st.rerun()
 
         st.markdown("""<div class="excel-header" style="display:flex"><div style="width:40%">TÊN VẬT TƯ</div><div style="width:25%">QUY ĐỔI</div><div style="width:20%;text-align:right">GIÁ CHUẨN</div><div style="width:15%;text-align:center">...</div></div>""", unsafe_allow_html=True)
@@ -729,14 +409,13 @@ def render_vattu_module(is_laptop):
         else: _render_master_items(df_paged)
 
     def render_export_vt():
-        if not df_pj.empty:
-            xp = st.selectbox("Dự án xuất:", ["TẤT CẢ"] + df_pj['TenDuAn'].unique().tolist())
+        if not df_tot.empty:
+            xp = st.selectbox("Dự án xuất:", ["TẤT CẢ"] + df_tot['TenDuAn'].unique().tolist())
             if st.button("TẢI EXCEL KÊ VẬT TƯ"):
                 if xp == "TẤT CẢ":
-                    data = df_pj.groupby(['MaVT','TenVT','DVT'], as_index=False).agg({'SoLuong':'sum','ThanhTien':'sum'})
-                    data['DonGia'] = data.apply(lambda x: x['ThanhTien']/x['SoLuong'] if x['SoLuong']>0 else 0, axis=1)
+                    data = summarize_project_materials(load_project_rows())
                 else:
-                    data = df_pj[df_pj['TenDuAn'] == xp]
+                    data = load_project_rows(xp)
                 
                 fname = f"Vật_tư_{xp.replace(' ', '_')}_{get_vn_time().strftime('%d-%m-%Y_%Hh%M')}.xlsx"
                 st.download_button("DOWNLOAD FILE", export_project_materials_excel(data, xp), fname)
@@ -771,7 +450,12 @@ if check_password():
                 change_password_ui()
                 st.divider()
                 if st.button("🔄 LÀM MỚI APP", use_container_width=True): clear_data_cache(); st.rerun()
-                if st.download_button("📥 TẢI BACKUP", data=generate_full_backup(), file_name=f"Backup_ERP_{get_vn_time().strftime('%d%m%Y')}.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True): pass
+                if st.button("🗄️ KHÓA SỔ NĂM CŨ", use_container_width=True):
+                    n = archive_closed_years(get_vn_time().year - 1); st.success(f"Đã lưu trữ {n} dòng!"); time.sleep(0.5); st.rerun()
+                if st.button("🧹 DỌN DÒNG ĐÃ XÓA", use_container_width=True):
+                    n = sum(compact_all_sheets().values()); st.success(f"Đã thu hồi {n} dòng!"); time.sleep(0.5); st.rerun()
+                if st.button("📦 TẠO BACKUP", use_container_width=True):
+                    st.download_button("📥 TẢI BACKUP", data=generate_full_backup(), file_name=f"Backup_ERP_{get_vn_time().strftime('%d%m%Y')}.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
     with c4:
         if st.button("🚪 THOÁT", use_container_width=True): st.session_state.role = None; st.rerun()
 
@@ -0,0 +1,5 @@
+"""Lớp dữ liệu & báo cáo của HỆ THỐNG ERP, dùng chung cho app Streamlit (app.py) và CLI (python -m erp).
+
+Gói này không import Streamlit: khi chạy headless, cache và secrets được xử lý trong erp.runtime.
+Các thư viện nặng (gspread, googleapiclient, xlsxwriter) chỉ được import khi thực sự cần.
+"""
@@ -0,0 +1,80 @@
+# ==================== CLI (cron / script) ====================
+# Ví dụ:
+#   python -m erp sync --archive-through 2024
+#   python -m erp compact
+#   python -m erp report --from 01/01/2025 --to 31/01/2025 -o Quyet_Toan.xlsx
+#   python -m erp export --project "Nha Pho Q7" -o Vat_tu.xlsx
+#   python -m erp backup -o Backup_ERP.xlsx
+# Secrets đọc từ .streamlit/secrets.toml (hoặc file trong biến môi trường ERP_SECRETS).
+import argparse
+from datetime import datetime
+
+def _parse_date(value): return datetime.strptime(value, '%d/%m/%Y').date()
+
+def _write(path, data):
+    with open(path, 'wb') as f: f.write(data)
+    print(f"Đã ghi {path}")
+
+def cmd_sync(args):
+    from .data import archive_closed_years, bootstrap_sheets
+    if args.archive_through: print(f"Đã lưu trữ {archive_closed_years(args.archive_through)} dòng")
+    for name, val in bootstrap_sheets().items(): print(f"{name}: {len(val)}")
+
+def cmd_compact(args):
+    from .data import compact_all_sheets
+    for name, n in compact_all_sheets().items(): print(f"{name}: thu hồi {n} dòng")
+
+def cmd_report(args):
+    from .reports import build_report, convert_df_to_excel_custom
+    from .utils import get_vn_time
+    today = get_vn_time().date()
+    d1, d2 = args.date_from or today.replace(day=1), args.date_to or today
+    report = build_report(d1, d2)
+    if args.output: _write(args.output, convert_df_to_excel_custom(report, d1, d2))
+    else: print(report.to_string(index=False) if not report.empty else "Không có dữ liệu")
+
+def cmd_export(args):
+    from .data import load_project_rows
+    from .reports import export_project_materials_excel, summarize_project_materials
+    from .utils import get_vn_time
+    data = load_project_rows(args.project)
+    if data.empty: print("Không có dữ liệu"); return 1
+    name = args.project or "TẤT CẢ"
+    if args.project is None: data = summarize_project_materials(data)
+    _write(args.output or f"Vật_tư_{name.replace(' ', '_')}_{get_vn_time().strftime('%d-%m-%Y_%Hh%M')}.xlsx", export_project_materials_excel(data, name))
+
+def cmd_backup(args):
+    from .reports import generate_full_backup
+    from .utils import get_vn_time
+    _write(args.output or f"Backup_ERP_{get_vn_time().strftime('%d%m%Y')}.xlsx", generate_full_backup())
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m erp", description="Công cụ dòng lệnh cho HỆ THỐNG ERP (không cần Streamlit).")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("sync", help="Tải lại toàn bộ sheet (tùy chọn: khóa sổ các năm cũ)")
+    p.add_argument("--archive-through", type=int, metavar="NĂM", help="Chuyển dữ liệu các năm <= NĂM sang phân vùng lưu trữ")
+    p.set_defaults(func=cmd_sync)
+
+    p = sub.add_parser("compact", help="Thu hồi các dòng đã xóa mềm (DaXoa)")
+    p.set_defaults(func=cmd_compact)
+
+    p = sub.add_parser("report", help="Sổ quỹ / quyết toán theo khoảng ngày")
+    p.add_argument("--from", dest="date_from", type=_parse_date, metavar="DD/MM/YYYY", help="Mặc định: đầu tháng hiện tại")
+    p.add_argument("--to", dest="date_to", type=_parse_date, metavar="DD/MM/YYYY", help="Mặc định: hôm nay")
+    p.add_argument("-o", "--output", help="Ghi file Excel quyết toán thay vì in ra màn hình")
+    p.set_defaults(func=cmd_report)
+
+    p = sub.add_parser("export", help="Xuất Excel bảng kê vật tư")
+    p.add_argument("--project", help="Tên dự án (bỏ trống = tổng hợp tất cả)")
+    p.add_argument("-o", "--output")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("backup", help="Xuất file backup toàn bộ dữ liệu")
+    p.add_argument("-o", "--output")
+    p.set_defaults(func=cmd_backup)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args) or 0
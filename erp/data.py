@@ -0,0 +1,463 @@
+# ==================== DATA LAYER ====================
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from .runtime import cache_data, cache_resource, clear_caches, get_workbook, get_worksheet
+from .scheduler import coalesce, defer
+from .utils import auto_capitalize, clean_note_and_link, generate_material_code, get_vn_time
+
+def clear_data_cache(): clear_caches(); bootstrap_sheets.clear()
+
+def invalidate_data_cache():
+    """Xóa cache sau khi ghi; trong coalesce() chỉ xóa một lần khi cả lô ghi đã gửi xong."""
+    defer(clear_data_cache)
+
+def write_cells(sheet_name, cells):
+    """Ghi các ô (row, col, value) của một sheet; mọi lệnh trong cùng coalesce() đi chung một values_batch_update."""
+    with coalesce() as batch: batch.update_cells(sheet_name, cells)
+
+def append_rows(sheet_name, rows):
+    with coalesce() as batch: batch.append_rows(sheet_name, rows)
+
+def _get_or_create_ws(name, headers):
+    """Chỉ tạo sheet khi sheet thực sự chưa có; lỗi mạng / quota thì ném ra cho người gọi."""
+    from gspread.exceptions import WorksheetNotFound
+    try: return get_worksheet(name)
+    except WorksheetNotFound:
+        ws = get_workbook().add_worksheet(name, 1000, len(headers)); ws.append_row(headers)
+        return ws
+
+# --- BOOTSTRAP: ĐỌC TẤT CẢ SHEET TRONG 1 LẦN GỌI API ---
+# values_batch_get lấy cả 5 sheet trong một request; nếu lỗi (vd. thiếu sheet) thì đọc song song từng sheet
+# bằng thread pool và tạo sheet còn thiếu để lần sau quay lại đường nhanh. Các loader bên dưới chỉ parse từ kết quả này.
+# Chỉ sheet chưa tồn tại mới được coi là trống: lỗi đọc khác làm bootstrap_sheets() ném lỗi nên không có gì bị
+# cache, và config không bao giờ được dựng từ giá trị mặc định khi đọc thất bại.
+BOOTSTRAP_SHEETS = {
+    "config": ["Key", "Value"],
+    "data": ["Ngay", "Loai", "SoTien", "MoTa", "HinhAnh"],
+    "data_duan": ["MaDuAn", "TenDuAn", "NgayNhap", "MaVT", "TenVT", "DVT", "SoLuong", "DonGia", "ThanhTien", "GhiChu", "LinkNCC"],
+    "dm_vattu": ["MaVT", "TenVT", "DVT_Cap1", "DVT_Cap2", "QuyDoi", "DonGia_Cap1"],
+    "checkpoint": ["Sheet", "Nam", "Khoa", "Ten", "GiaTri"],
+}
+RENDER_OPTS = {'valueRenderOption': 'UNFORMATTED_VALUE', 'dateTimeRenderOption': 'FORMATTED_STRING'}
+
+# --- XÓA MỀM (TOMBSTONE) ---
+# Xóa = ghi thời điểm xóa vào cột 'DaXoa' ngay sau các cột dữ liệu, không delete_rows nên Row_Index của các dòng
+# khác vẫn đúng. Loader lọc bỏ các dòng có cờ; compact_sheet() ghi lại sheet để thu hồi các dòng này.
+TOMBSTONE_HEADER = "DaXoa"
+TOMBSTONE_COLS = {name: len(BOOTSTRAP_SHEETS[name]) + 1 for name in ("data", "data_duan", "dm_vattu")}
+
+def _is_tombstoned(col): return col.astype(str).str.strip() != ""
+
+def _drop_tombstoned(df):
+    if TOMBSTONE_HEADER not in df.columns: return df
+    return df[~_is_tombstoned(df[TOMBSTONE_HEADER])].drop(columns=TOMBSTONE_HEADER)
+
+def _values_to_records(values):
+    if not values: return []
+    header = values[0]
+    return [dict(zip(header, list(r) + [""] * (len(header) - len(r)))) for r in values[1:]]
+
+def _fetch_sheet_values(name):
+    return _get_or_create_ws(name, BOOTSTRAP_SHEETS[name]).get_all_values(value_render_option=RENDER_OPTS['valueRenderOption'], date_time_render_option=RENDER_OPTS['dateTimeRenderOption'])
+
+def _batch_get_values():
+    from gspread.exceptions import APIError
+    names = list(BOOTSTRAP_SHEETS)
+    try:
+        res = get_workbook().values_batch_get([f"'{n}'" for n in names], params=RENDER_OPTS)
+        return {n: vr.get('values', []) for n, vr in zip(names, res['valueRanges'])}
+    except APIError as e:
+        # Chỉ đọc lẻ từng sheet khi batch lỗi vì thiếu sheet; 429 / quota / 5xx thì ném ra, không đẻ thêm 5 request
+        if e.code != 400 or "parse range" not in str(e.error.get("message", "")): raise
+        with ThreadPoolExecutor(max_workers=len(names)) as ex:
+            futs = {n: ex.submit(_fetch_sheet_values, n) for n in names}
+            return {n: f.result() for n, f in futs.items()}
+
+@cache_resource(ttl=300)
+def bootstrap_sheets():
+    values = _batch_get_values()
+    parsers = {"config": _parse_config, "data": _parse_ledger, "data_duan": _parse_project, "dm_vattu": _parse_materials, "checkpoint": _parse_checkpoints}
+    with ThreadPoolExecutor(max_workers=len(parsers)) as ex:
+        futs = {n: ex.submit(_safe_parse, fn, _values_to_records(values.get(n, []))) for n, fn in parsers.items()}
+        res = {n: f.result() for n, f in futs.items()}
+    res["config_rows"] = {str(r[0]): i for i, r in enumerate(values.get("config", [])[1:], start=2) if r}
+    return res
+
+def _safe_parse(fn, records):
+    """Sheet sai định dạng thì coi như trống như các loader cũ, trừ config: lỗi phải ném ra để không dùng mật khẩu mặc định."""
+    if fn is _parse_config: return fn(records)
+    try: return fn(records)
+    except: return fn([])
+
+def _parse_config(records):
+    config = {row['Key']: str(row['Value']) for row in records}
+    if 'admin_pwd' not in config: config['admin_pwd'] = "admin123"
+    if 'viewer_pwd' not in config: config['viewer_pwd'] = "xem123"
+    if 'debt_1_name' not in config: config['debt_1_name'] = "SAMSUNG S1 HN"
+    if 'debt_1_val' not in config: config['debt_1_val'] = "-4000000"
+    if 'debt_2_name' not in config: config['debt_2_name'] = "TẾT 2025"
+    if 'debt_2_val' not in config: config['debt_2_val'] = "-5000000"
+    return config
+
+@cache_data(ttl=300)
+def load_config(): return bootstrap_sheets()["config"]
+
+def _config_row(key):
+    """Dòng của key trong sheet config, None nếu chưa có. Key không có trong bootstrap (có thể đã cũ: key vừa được thêm ở
+    phiên / tiến trình khác) thì tra lại cột Key trên sheet để không append dòng trùng; mỗi lô coalesce() chỉ đọc một lần."""
+    row = bootstrap_sheets()["config_rows"].get(key)
+    if row: return row
+    with coalesce() as batch: keys = batch.memo("config_keys", lambda: get_worksheet("config").col_values(1))
+    return keys.index(key) + 1 if key in keys else None
+
+def _set_config_value(key, value):
+    row = _config_row(key)
+    if row: write_cells("config", [(row, 2, str(value))])
+    else: append_rows("config", [[key, str(value)]])
+    invalidate_data_cache()
+
+def update_config_values(values):
+    """Ghi nhiều key config trong một lô; lỗi API (kể cả khi gửi lô) trả về False thay vì ném ra UI."""
+    try:
+        with coalesce():
+            for key, value in values.items(): _set_config_value(key, value)
+        return True
+    except: return False
+
+def update_config_value(key, value): return update_config_values({key: value})
+
+# --- MỐC ROW_INDEX ---
+# Compact / khóa sổ (kể cả từ cron ở tiến trình khác) làm dịch Row_Index, trong khi app còn giữ cache 300s.
+# Trước khi dịch dòng, 'row_gen' trong config được đổi. UI lưu mốc lúc bấm ✏️ cùng Row_Index (current_row_generation);
+# hàm ghi theo Row_Index so mốc đó với mốc trên sheet và kiểm tra dòng đích chưa bị xóa mềm ở phiên khác,
+# không thỏa thì không ghi mà tải lại cache và trả về False.
+ROW_GEN_KEY = "row_gen"
+
+def current_row_generation(): return load_config().get(ROW_GEN_KEY, "")
+
+def _bump_row_generation(): _set_config_value(ROW_GEN_KEY, "v" + get_vn_time().strftime('%Y%m%d%H%M%S%f'))
+
+def _row_writable(sheet_name, row_idx, row_gen=None):
+    """row_gen: mốc lúc lấy Row_Index (None = mốc của cache hiện tại, vd. nút xóa vừa render).
+    Chỉ đọc ô row_gen và dòng đích, chung một request values_batch_get."""
+    gen_row, row_idx = _config_row(ROW_GEN_KEY), int(row_idx)
+    ranges = [f"'{sheet_name}'!{row_idx}:{row_idx}"] + ([f"'config'!B{gen_row}"] if gen_row else [])
+    res = [vr.get('values', [[]])[0] for vr in get_workbook().values_batch_get(ranges, params=RENDER_OPTS)['valueRanges']]
+    row, live_gen = res[0], str(res[1][0]) if gen_row and res[1] else ""
+    col = TOMBSTONE_COLS[sheet_name]
+    same_gen = live_gen == (current_row_generation() if row_gen is None else row_gen)
+    if same_gen and not (len(row) >= col and str(row[col - 1]).strip()): return True
+    clear_data_cache(); return False
+
+def _parse_ledger(records):
+    df = pd.DataFrame(records)
+    if df.empty: return pd.DataFrame()
+    df['Row_Index'] = range(2, len(df) + 2)
+    df = _drop_tombstoned(df)
+    df['Ngay'] = pd.to_datetime(df['Ngay'], dayfirst=True, errors='coerce')
+    df['SoTien'] = pd.to_numeric(df['SoTien'], errors='coerce').fillna(0).astype('float')
+    return df.dropna(subset=['Ngay'])
+
+@cache_data(ttl=300)
+def load_data_with_index():
+    try: return bootstrap_sheets()["data"]
+    except: return pd.DataFrame()
+
+def _parse_materials(records):
+    df = pd.DataFrame(records)
+    if 'TenVT' not in df.columns: return pd.DataFrame(columns=["MaVT", "TenVT", "DVT_Cap1", "DVT_Cap2", "QuyDoi", "DonGia_Cap1"])
+    df['Row_Index'] = range(2, len(df) + 2)
+    return _drop_tombstoned(df)
+
+@cache_data(ttl=300)
+def load_materials_master():
+    try: return bootstrap_sheets()["dm_vattu"]
+    except: return pd.DataFrame(columns=["MaVT", "TenVT", "DVT_Cap1", "DVT_Cap2", "QuyDoi", "DonGia_Cap1"])
+
+def _parse_project(records):
+    df = pd.DataFrame(records)
+    if df.empty: return pd.DataFrame(columns=["MaDuAn", "TenDuAn", "NgayNhap", "MaVT", "TenVT", "DVT", "SoLuong", "DonGia", "ThanhTien", "GhiChu", "LinkNCC"])
+    for col in ['SoLuong', 'DonGia', 'ThanhTien']: df[col] = pd.to_numeric(df.get(col, 0), errors='coerce').fillna(0)
+    if 'LinkNCC' not in df.columns: df['LinkNCC'] = ""
+    df['MaDuAn'] = df['MaDuAn'].astype(str)
+    df['Row_Index'] = range(2, len(df) + 2)
+    return _drop_tombstoned(df)
+
+@cache_data(ttl=300)
+def load_project_data():
+    try: return bootstrap_sheets()["data_duan"]
+    except: return pd.DataFrame()
+
+# --- PHÂN VÙNG THEO NĂM (ARCHIVE + CHECKPOINT) ---
+# Năm đã khóa sổ được chuyển sang sheet riêng 'data_<năm>' / 'data_duan_<năm>'.
+# Sheet 'checkpoint' lưu tổng thu/chi/số dư lũy kế cuối mỗi năm và tổng tiền từng dự án theo năm,
+# nên báo cáo chỉ cần đọc các phân vùng giao với khoảng ngày + sheet hiện hành.
+CHECKPOINT_SHEET = "checkpoint"
+CHECKPOINT_HEADERS = BOOTSTRAP_SHEETS[CHECKPOINT_SHEET]
+
+def _parse_checkpoints(records):
+    df = pd.DataFrame(records, columns=CHECKPOINT_HEADERS)
+    df['Nam'] = pd.to_numeric(df['Nam'], errors='coerce').fillna(0).astype(int)
+    df['GiaTri'] = pd.to_numeric(df['GiaTri'], errors='coerce').fillna(0).astype('float')
+    df['Khoa'] = df['Khoa'].astype(str)
+    return df
+
+# Checkpoint và phân vùng năm không nuốt lỗi đọc: thiếu một năm trong khi số dư đầu kỳ đã trừ năm đó sẽ làm báo cáo sai
+# mà không ai biết. Lỗi được ném ra nên không bị cache; chỉ sheet năm chưa tồn tại mới được coi là trống.
+@cache_data(ttl=300)
+def load_checkpoints(): return bootstrap_sheets()[CHECKPOINT_SHEET]
+
+def _partition_records(name):
+    """Bản ghi của sheet phân vùng, đọc cùng RENDER_OPTS với sheet hiện hành; [] nếu sheet chưa có."""
+    from gspread.exceptions import WorksheetNotFound
+    try: ws = get_worksheet(name)
+    except WorksheetNotFound: return []
+    return _values_to_records(ws.get_all_values(value_render_option=RENDER_OPTS['valueRenderOption'], date_time_render_option=RENDER_OPTS['dateTimeRenderOption']))
+
+@cache_data(ttl=3600)
+def load_data_partition(year):
+    df = _parse_ledger(_partition_records(f"data_{year}"))
+    if not df.empty: df['LuuTru'] = year
+    return df
+
+@cache_data(ttl=3600)
+def load_project_partition(year):
+    df = _parse_project(_partition_records(f"data_duan_{year}"))
+    if not df.empty: df['LuuTru'] = year
+    return df
+
+def get_archived_years(sheet_name):
+    cp = load_checkpoints()
+    return sorted(cp[cp['Sheet'] == sheet_name]['Nam'].unique().tolist())
+
+def get_ledger_checkpoint(before_year=None):
+    """(Số dư, Tổng thu, Tổng chi) lũy kế tại năm đã lưu trữ gần nhất trước `before_year` (None = năm mới nhất)."""
+    cp = load_checkpoints()
+    led = cp[cp['Sheet'] == 'data']
+    if before_year is not None: led = led[led['Nam'] < before_year]
+    if led.empty: return 0.0, 0.0, 0.0
+    last = led[led['Nam'] == led['Nam'].max()].set_index('Khoa')['GiaTri']
+    return float(last.get('SoDu', 0)), float(last.get('TongThu', 0)), float(last.get('TongChi', 0))
+
+def load_ledger_range(start_date, end_date):
+    """Ghép các phân vùng năm giao với [start_date, end_date] và sheet 'data' hiện hành; trả về (df, số dư checkpoint trước kỳ)."""
+    years = [y for y in get_archived_years("data") if start_date.year <= y <= end_date.year]
+    frames = [f for f in [load_data_partition(y) for y in years] + [load_data_with_index()] if not f.empty]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return df, get_ledger_checkpoint(start_date.year)[0]
+
+def load_project_totals():
+    """Tổng tiền theo dự án: checkpoint các năm đã lưu trữ + sheet 'data_duan' hiện hành."""
+    cp = load_checkpoints(); df_pj = load_project_data()
+    frames = [cp[cp['Sheet'] == 'data_duan'].rename(columns={'Khoa': 'MaDuAn', 'Ten': 'TenDuAn', 'GiaTri': 'ThanhTien'})[['MaDuAn', 'TenDuAn', 'ThanhTien']]]
+    if not df_pj.empty: frames.append(df_pj[['MaDuAn', 'TenDuAn', 'ThanhTien']])
+    return pd.concat(frames, ignore_index=True).groupby(['MaDuAn', 'TenDuAn'], as_index=False, sort=False)['ThanhTien'].sum()
+
+def load_project_rows(proj_name=None):
+    """Chi tiết vật tư của một dự án (None = tất cả); chỉ đọc các phân vùng năm có chứa dự án đó."""
+    cp = load_checkpoints(); df_pj = load_project_data()
+    arch = cp[cp['Sheet'] == 'data_duan']
+    if proj_name is not None: arch = arch[arch['Ten'] == proj_name]
+    frames = [f for f in [load_project_partition(y) for y in sorted(arch['Nam'].unique())] + [df_pj] if not f.empty]
+    if proj_name is not None: frames = [f[f['TenDuAn'] == proj_name] for f in frames]
+    return pd.concat(frames, ignore_index=True) if frames else _parse_project([])
+
+def _ledger_checkpoint_rows(cp, year_totals):
+    """year_totals: {năm: (thu, chi)} tính lại từ toàn bộ sheet năm; các năm còn lại lấy từ checkpoint cũ (lũy kế -> theo năm)."""
+    per_year, prev = {}, (0.0, 0.0)
+    for n, g in cp[cp['Sheet'] == 'data'].groupby('Nam'):
+        v = g.set_index('Khoa')['GiaTri']; cum = (float(v.get('TongThu', 0)), float(v.get('TongChi', 0)))
+        per_year[int(n)] = (cum[0] - prev[0], cum[1] - prev[1]); prev = cum
+    per_year.update(year_totals)
+    rows, thu, chi = [], 0.0, 0.0
+    for y in sorted(per_year):
+        thu += per_year[y][0]; chi += per_year[y][1]
+        rows += [["data", y, "SoDu", "Số dư cuối năm", thu - chi], ["data", y, "TongThu", "Tổng thu lũy kế", thu], ["data", y, "TongChi", "Tổng chi lũy kế", chi]]
+    return rows
+
+def _project_checkpoint_rows(cp, parts):
+    """Tổng tiền từng dự án theo năm: năm vừa lưu trữ tính lại từ sheet năm, năm khác giữ nguyên checkpoint cũ."""
+    old = cp[(cp['Sheet'] == 'data_duan') & ~cp['Nam'].isin(list(parts))]
+    rows = [["data_duan", int(n), k, t, float(v)] for n, k, t, v in old[['Nam', 'Khoa', 'Ten', 'GiaTri']].values.tolist()]
+    for y, part in sorted(parts.items()):
+        tot = part.assign(_Tien=pd.to_numeric(part['ThanhTien'], errors='coerce').fillna(0), MaDuAn=part['MaDuAn'].astype(str))
+        rows += [["data_duan", y, k, t, float(v)] for k, t, v in tot.groupby(['MaDuAn', 'TenDuAn'], as_index=False)['_Tien'].sum().values.tolist()]
+    return sorted(rows, key=lambda r: (r[1], str(r[2])))
+
+def _sheet_frame(ws):
+    """(header, DataFrame các dòng chưa xóa mềm, tổng số dòng đang có trên sheet)."""
+    values = ws.get_all_values(value_render_option=RENDER_OPTS['valueRenderOption'], date_time_render_option=RENDER_OPTS['dateTimeRenderOption'])
+    header = values[0] if values else []
+    df = pd.DataFrame([list(r[:len(header)]) + [""] * (len(header) - len(r)) for r in values[1:]], columns=header, dtype=object)
+    if TOMBSTONE_HEADER in df.columns: df = df[~_is_tombstoned(df[TOMBSTONE_HEADER])]
+    return header, df, len(values)
+
+def _overwrite_sheet(ws, rows, old_len):
+    """Ghi đè sheet bằng một request update, đệm dòng trống tới độ dài cũ. Không dùng clear(): lỗi giữa chừng không làm mất
+    dữ liệu, và dòng được append sau lúc đọc (nằm sau old_len) vẫn giữ nguyên."""
+    width = max(len(r) for r in rows)
+    body = [list(r) + [""] * (width - len(r)) for r in rows]
+    body += [[""] * width for _ in range(old_len - len(body))]
+    ws.update(values=body, range_name='A1')
+
+def _row_keys(df, cols):
+    return df[cols].astype(str).apply(lambda r: "\x1f".join(r), axis=1) if not df.empty else pd.Series(dtype=str)
+
+def _copy_to_year_sheets(sheet_name, date_col, up_to_year, dayfirst):
+    """Chép các dòng có năm <= up_to_year sang sheet '<sheet_name>_<năm>'. Dòng đã có ở sheet năm (lần chạy trước bị ngắt)
+    không chép lại. Trả về (ws, header, df, mask dòng chuyển, số dòng cũ, {năm: toàn bộ dòng của sheet năm}) hoặc None."""
+    try: ws = get_worksheet(sheet_name)
+    except: return None
+    header, df, old_len = _sheet_frame(ws)
+    if df.empty: return None
+    mv = pd.to_datetime(df[date_col], dayfirst=dayfirst, errors='coerce').dt.year.le(up_to_year)
+    if not mv.any(): return None
+    years = pd.to_datetime(df.loc[mv, date_col], dayfirst=dayfirst, errors='coerce').dt.year.astype(int)
+    parts = {}
+    for y, part in df[mv].groupby(years):
+        y_ws = _get_or_create_ws(f"{sheet_name}_{y}", header)
+        y_header, y_df, _ = _sheet_frame(y_ws)
+        cols = [c for c in header if c and c != TOMBSTONE_HEADER and c in y_df.columns]
+        seen = _row_keys(y_df, cols).value_counts().to_dict()
+        is_new = []
+        for key in _row_keys(part, cols):
+            is_new.append(seen.get(key, 0) <= 0)
+            if not is_new[-1]: seen[key] -= 1
+        new = part[is_new]
+        if not new.empty: y_ws.append_rows(new.reindex(columns=y_header, fill_value="").values.tolist())
+        parts[int(y)] = pd.concat([y_df[cols], new[cols]], ignore_index=True)
+    return ws, header, df, mv, old_len, parts
+
+def archive_closed_years(up_to_year):
+    """Khóa sổ: chuyển dữ liệu các năm <= up_to_year sang phân vùng năm và cập nhật checkpoint. Trả về số dòng đã chuyển.
+
+    Thứ tự: chép sang sheet năm -> ghi checkpoint (tính lại từ sheet năm) -> đổi mốc row_gen -> ghi đè sheet gốc. Nếu bị ngắt giữa chừng,
+    chạy lại sẽ không chép trùng và không cộng trùng vào checkpoint."""
+    ws_cp = _get_or_create_ws(CHECKPOINT_SHEET, CHECKPOINT_HEADERS)
+    cp_values = ws_cp.get_all_values(value_render_option=RENDER_OPTS['valueRenderOption'], date_time_render_option=RENDER_OPTS['dateTimeRenderOption'])
+    cp = _parse_checkpoints(_values_to_records(cp_values))
+
+    tc = _copy_to_year_sheets("data", 'Ngay', up_to_year, True)
+    pj = _copy_to_year_sheets("data_duan", 'NgayNhap', up_to_year, False)
+    if tc is None and pj is None: return 0
+
+    year_totals = {}
+    for y, part in (tc[5] if tc else {}).items():
+        tien = pd.to_numeric(part['SoTien'], errors='coerce').fillna(0)
+        year_totals[y] = (float(tien[part['Loai'] == 'Thu'].sum()), float(tien[part['Loai'] == 'Chi'].sum()))
+    rows = _ledger_checkpoint_rows(cp, year_totals) + _project_checkpoint_rows(cp, pj[5] if pj else {})
+    _overwrite_sheet(ws_cp, [CHECKPOINT_HEADERS] + rows, len(cp_values))
+
+    _bump_row_generation()
+    moved = 0
+    for split in (tc, pj):
+        if split is None: continue
+        ws, header, df, mv, old_len, _ = split
+        moved += int(mv.sum())
+        _overwrite_sheet(ws, [header] + df.loc[~mv, header].values.tolist(), old_len)
+    clear_data_cache()
+    return moved
+
+# --- WRITE FUNCTIONS & HOTFIXES ---
+def update_password(role, new_pwd):
+    key = 'admin_pwd' if role == 'admin' else 'viewer_pwd'
+    return update_config_value(key, new_pwd)
+
+def add_transaction(date, category, amount, description, image_link):
+    append_rows("data", [[date.strftime('%Y-%m-%d'), category, amount, auto_capitalize(description), image_link]])
+    invalidate_data_cache()
+
+def update_transaction(row_idx, date, category, amount, description, image_link, row_gen=None):
+    if not _row_writable("data", row_idx, row_gen): return False
+    cells = [(row_idx, 1, date.strftime('%Y-%m-%d')), (row_idx, 2, category), (row_idx, 3, amount), (row_idx, 4, auto_capitalize(description))]
+    if image_link: cells.append((row_idx, 5, image_link))
+    write_cells("data", cells)
+    invalidate_data_cache(); return True
+
+def delete_transaction(sheet_name, row_idx):
+    if not _row_writable(sheet_name, row_idx): return False
+    ws = get_worksheet(sheet_name)
+    col = TOMBSTONE_COLS[sheet_name]
+    if ws.col_count < col: ws.add_cols(col - ws.col_count)
+    write_cells(sheet_name, [(1, col, TOMBSTONE_HEADER), (row_idx, col, get_vn_time().strftime('%Y-%m-%d %H:%M:%S'))])
+    _forget_rows(sheet_name, [int(row_idx)]); return True
+
+def _forget_rows(sheet_name, row_indices):
+    """Bỏ các dòng khỏi frame đã nạp trong bootstrap và chỉ xóa cache của loader tương ứng, không tải lại từ API."""
+    boot = bootstrap_sheets()
+    df = boot.get(sheet_name)
+    if df is not None and 'Row_Index' in df.columns: boot[sheet_name] = df[~df['Row_Index'].isin(row_indices)]
+    {"data": load_data_with_index, "data_duan": load_project_data, "dm_vattu": load_materials_master}[sheet_name].clear()
+
+def compact_sheet(sheet_name):
+    """Xóa hẳn các dòng đã xóa mềm bằng deleteDimension trong một batch_update (lưới sheet co lại theo); trả về số dòng thu hồi."""
+    ws = get_worksheet(sheet_name)
+    values = ws.get_all_values(value_render_option=RENDER_OPTS['valueRenderOption'], date_time_render_option=RENDER_OPTS['dateTimeRenderOption'])
+    if len(values) < 2 or TOMBSTONE_HEADER not in values[0]: return 0
+    col = values[0].index(TOMBSTONE_HEADER)
+    spans = []
+    for i, r in enumerate(values[1:], start=1):
+        if not (len(r) > col and str(r[col]).strip()): continue
+        if spans and spans[-1][1] == i: spans[-1][1] = i + 1
+        else: spans.append([i, i + 1])
+    if not spans: return 0
+    _bump_row_generation()
+    ws.spreadsheet.batch_update({'requests': [{'deleteDimension': {'range': {'sheetId': ws.id, 'dimension': 'ROWS', 'startIndex': s, 'endIndex': e}}} for s, e in reversed(spans)]})
+    return sum(e - s for s, e in spans)
+
+def compact_all_sheets():
+    """Dọn toàn bộ dòng đã xóa mềm (admin hoặc cron: python -m erp compact). Trả về {sheet: số dòng}."""
+    res = {name: compact_sheet(name) for name in TOMBSTONE_COLS}
+    if any(res.values()): clear_data_cache()
+    return res
+
+def delete_material_row(row_idx):
+    return delete_transaction("data_duan", row_idx)
+
+def save_project_material(proj_code, proj_name, mat_name, unit1, unit2, ratio, user_input_price, selected_unit, qty, note, link_ncc, is_new_item=False):
+    mat_code = ""
+    proj_name = auto_capitalize(proj_name); mat_name = auto_capitalize(mat_name)
+    final_price = float(user_input_price)
+    thanh_tien = float(qty) * final_price
+    final_note, final_link = clean_note_and_link(note, link_ncc)
+    
+    if is_new_item:
+        _get_or_create_ws("dm_vattu", BOOTSTRAP_SHEETS["dm_vattu"])
+        mat_code = generate_material_code(mat_name)
+        master_price = final_price if selected_unit == unit1 else final_price * float(ratio)
+        master_row = [mat_code, mat_name, auto_capitalize(unit1), auto_capitalize(unit2), ratio, master_price]
+    else:
+        df_master = load_materials_master()
+        if not df_master.empty:
+            found = df_master[df_master['TenVT'] == mat_name]
+            if not found.empty: mat_code = found.iloc[0]['MaVT']
+    
+    ws_data = _get_or_create_ws("data_duan", BOOTSTRAP_SHEETS["data_duan"])
+    if ws_data.col_count < 11: ws_data.add_cols(11 - ws_data.col_count)
+    headers = ws_data.row_values(1)
+
+    row_data = [proj_code, proj_name, get_vn_time().strftime('%Y-%m-%d %H:%M:%S'), mat_code, mat_name, selected_unit, qty, final_price, thanh_tien, final_note, final_link]
+    with coalesce():
+        if is_new_item: append_rows("dm_vattu", [master_row])
+        if len(headers) < 11: write_cells("data_duan", [(1, 11, "LinkNCC")])
+        append_rows("data_duan", [row_data])
+        invalidate_data_cache()
+
+def update_material_row(row_idx, qty, price, note, link_ncc, row_gen=None):
+    if not _row_writable("data_duan", row_idx, row_gen): return False
+    final_note, final_link = clean_note_and_link(note, link_ncc)
+    sheet = get_worksheet("data_duan")
+    cells = [(row_idx, 7, qty), (row_idx, 8, price), (row_idx, 9, float(qty) * float(price)), (row_idx, 10, final_note), (row_idx, 11, final_link)]
+    if sheet.col_count < 11:
+        sheet.add_cols(11 - sheet.col_count)
+        cells.append((1, 11, "LinkNCC"))
+    write_cells("data_duan", cells)
+    invalidate_data_cache(); return True
+
+def update_master_material(row_idx, name, u1, u2, ratio, price, row_gen=None):
+    if not _row_writable("dm_vattu", row_idx, row_gen): return False
+    write_cells("dm_vattu", [(row_idx, 2, auto_capitalize(name)), (row_idx, 3, auto_capitalize(u1)), (row_idx, 4, auto_capitalize(u2)), (row_idx, 5, ratio), (row_idx, 6, price)])
+    invalidate_data_cache(); return True
+
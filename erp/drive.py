@@ -0,0 +1,50 @@
+# ==================== GOOGLE DRIVE ====================
+from .runtime import cache_resource, get_creds, get_secret
+
+DRIVE_API = "https://www.googleapis.com/drive/v3/files"
+
+@cache_resource()
+def get_authorized_session():
+    from google.auth.transport.requests import AuthorizedSession
+    return AuthorizedSession(get_creds())
+
+def upload_image_to_drive(image_file, file_name, app_properties=None, mimetype='image/jpeg'):
+    try:
+        from googleapiclient.discovery import build
+        from googleapiclient.http import MediaIoBaseUpload
+        creds = get_creds(); service = build('drive', 'v3', credentials=creds); folder_id = get_secret("DRIVE_FOLDER_ID")
+        media = MediaIoBaseUpload(image_file, mimetype=mimetype)
+        body = {'name': file_name, 'parents': [folder_id]}
+        if app_properties: body['appProperties'] = app_properties
+        file = service.files().create(body=body, media_body=media, fields='webViewLink').execute()
+        return file.get('webViewLink')
+    except: return ""
+
+def find_drive_file_by_property(key, value):
+    """webViewLink của file (chưa xóa) trong thư mục Drive có appProperties[key] == value, hoặc ""."""
+    try:
+        q = f"appProperties has {{ key='{key}' and value='{value}' }} and '{get_secret('DRIVE_FOLDER_ID')}' in parents and trashed=false"
+        resp = get_authorized_session().get(DRIVE_API, params={'q': q, 'fields': 'files(webViewLink)', 'pageSize': 1}, timeout=10)
+        files = resp.json().get('files', []) if resp.ok else []
+        return files[0].get('webViewLink', "") if files else ""
+    except: return ""
+
+def drive_file_exists(file_id):
+    """False nếu file không còn (404) hoặc đã vào thùng rác; lỗi mạng thì coi như còn để không upload trùng."""
+    if not file_id: return False
+    try:
+        resp = get_authorized_session().get(f"{DRIVE_API}/{file_id}", params={'fields': 'trashed'}, timeout=10)
+        if resp.status_code == 404: return False
+        return not (resp.ok and resp.json().get('trashed'))
+    except: return True
+
+def fetch_drive_thumbnail(file_id):
+    """Ảnh thu nhỏ do Drive sinh sẵn (thumbnailLink), không tải ảnh gốc."""
+    try:
+        session = get_authorized_session()
+        meta = session.get(f"{DRIVE_API}/{file_id}", params={'fields': 'thumbnailLink'}, timeout=10)
+        link = meta.json().get('thumbnailLink') if meta.ok else None
+        if not link: return None
+        resp = session.get(link, timeout=10)
+        return resp.content if resp.ok else None
+    except: return None
@@ -0,0 +1,128 @@
+# ==================== KHO ẢNH CHỨNG TỪ ====================
+# Ảnh chứng từ được định danh bằng SHA-256 của nội dung: ảnh trùng không upload lại mà dùng lại link cũ
+# (tra chỉ mục cục bộ trước, sau đó tra appProperties 'sha256' trên Drive). Link lấy từ chỉ mục được kiểm tra lại trên
+# Drive: file đã bị xóa / vào thùng rác thì bỏ khỏi chỉ mục và upload lại.
+# Thumbnail được lưu ở thư mục cache cục bộ có giới hạn dung lượng, xóa theo LRU (mtime được cập nhật mỗi lần đọc).
+# File không lấy được thumbnail được nhớ tạm (có TTL, giới hạn số lượng) để không gọi Drive lại ở mỗi lần render.
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from .drive import drive_file_exists, fetch_drive_thumbnail, find_drive_file_by_property, upload_image_to_drive
+
+CACHE_DIR = os.environ.get("ERP_CACHE_DIR", os.path.join(".cache", "erp"))
+THUMB_DIR = os.path.join(CACHE_DIR, "thumbs")
+INDEX_FILE = os.path.join(CACHE_DIR, "receipts.json")
+THUMB_CACHE_BYTES = int(os.environ.get("ERP_THUMB_CACHE_MB", "50")) * 1024 * 1024
+THUMB_PX = 160
+NO_THUMB_TTL = int(os.environ.get("ERP_NO_THUMB_TTL", "600"))
+NO_THUMB_MAX = 1000
+
+_lock = threading.Lock()
+_no_thumbnail = {}
+
+def _skip_thumbnail(file_id):
+    with _lock:
+        expires = _no_thumbnail.get(file_id)
+        if expires is not None and expires < time.monotonic(): del _no_thumbnail[file_id]; expires = None
+    return expires is not None
+
+def _mark_no_thumbnail(file_id):
+    with _lock:
+        _no_thumbnail.pop(file_id, None); _no_thumbnail[file_id] = time.monotonic() + NO_THUMB_TTL
+        while len(_no_thumbnail) > NO_THUMB_MAX: del _no_thumbnail[next(iter(_no_thumbnail))]
+
+def _read_index():
+    try:
+        with open(INDEX_FILE, encoding="utf-8") as f: return json.load(f)
+    except: return {}
+
+def _index_put(digest, link):
+    with _lock:
+        idx = _read_index()
+        if link: idx[digest] = link
+        else: idx.pop(digest, None)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(INDEX_FILE, "w", encoding="utf-8") as f: json.dump(idx, f)
+
+def drive_file_id(link):
+    m = re.search(r"/d/([\w-]+)|[?&]id=([\w-]+)", str(link))
+    return (m.group(1) or m.group(2)) if m else ""
+
+def make_thumbnail(data):
+    try:
+        from PIL import Image
+        img = Image.open(BytesIO(data)); img.thumbnail((THUMB_PX, THUMB_PX))
+        out = BytesIO(); img.convert("RGB").save(out, "JPEG", quality=70)
+        return out.getvalue()
+    except: return None
+
+def _thumb_path(file_id): return os.path.join(THUMB_DIR, f"{file_id}.img")
+
+def _evict_thumbnails():
+    entries = []
+    for name in os.listdir(THUMB_DIR):
+        stat = os.stat(os.path.join(THUMB_DIR, name)); entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(e[1] for e in entries)
+    for _, size, name in sorted(entries):
+        if total <= THUMB_CACHE_BYTES: break
+        try: os.remove(os.path.join(THUMB_DIR, name)); total -= size
+        except OSError: pass
+
+def _put_thumbnail(file_id, data):
+    with _lock:
+        os.makedirs(THUMB_DIR, exist_ok=True)
+        with open(_thumb_path(file_id), "wb") as f: f.write(data)
+        _evict_thumbnails()
+
+def _get_cached_thumbnail(file_id):
+    path = _thumb_path(file_id)
+    try:
+        with open(path, "rb") as f: data = f.read()
+        os.utime(path)
+        return data
+    except OSError: return None
+
+def store_receipt(image_file, name_prefix="TC"):
+    """Lưu ảnh chứng từ lên Drive theo hash nội dung; ảnh đã có thì trả về link cũ, không upload lại."""
+    data = image_file.getvalue() if hasattr(image_file, "getvalue") else image_file.read()
+    digest = hashlib.sha256(data).hexdigest()
+    link = _read_index().get(digest)
+    if link and not drive_file_exists(drive_file_id(link)): _index_put(digest, ""); link = ""
+    link = link or find_drive_file_by_property("sha256", digest)
+    if not link:
+        link = upload_image_to_drive(BytesIO(data), f"{name_prefix}_{digest[:12]}", app_properties={"sha256": digest}, mimetype=getattr(image_file, "type", None) or "image/jpeg")
+    if link:
+        _index_put(digest, link)
+        thumb, file_id = make_thumbnail(data), drive_file_id(link)
+        if thumb and file_id and _get_cached_thumbnail(file_id) is None: _put_thumbnail(file_id, thumb)
+    return link
+
+def get_receipt_thumbnail(link):
+    file_id = drive_file_id(link)
+    if not file_id or _skip_thumbnail(file_id): return None
+    data = _get_cached_thumbnail(file_id)
+    if data is None:
+        raw = fetch_drive_thumbnail(file_id)
+        data = (make_thumbnail(raw) or raw) if raw else None
+        if data: _put_thumbnail(file_id, data)
+        else: _mark_no_thumbnail(file_id)
+    return data
+
+def get_receipt_thumbnails(links):
+    """{link: data URI} cho các link có thumbnail; ảnh chưa có trong cache được tải song song."""
+    links = [l for l in dict.fromkeys(str(x).strip() for x in links) if l]
+    if not links: return {}
+    with ThreadPoolExecutor(max_workers=min(8, len(links))) as ex:
+        thumbs = dict(zip(links, ex.map(get_receipt_thumbnail, links)))
+    return {l: _data_uri(t) for l, t in thumbs.items() if t}
+
+def _data_uri(data):
+    mime = "image/png" if data[:4] == b"\x89PNG" else "image/jpeg"
+    return f"data:{mime};base64,{base64.b64encode(data).decode()}"
@@ -0,0 +1,155 @@
+# ==================== EXCEL, BÁO CÁO & BACKUP ====================
+from io import BytesIO
+
+import pandas as pd
+
+from .data import (get_archived_years, load_checkpoints, load_config, load_data_partition, load_data_with_index,
+                   load_ledger_range, load_materials_master, load_project_data, load_project_partition)
+from .utils import auto_capitalize, extract_domain, get_vn_time
+
+def generate_full_backup():
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        load_data_with_index().to_excel(writer, sheet_name='ThuChi', index=False)
+        load_project_data().to_excel(writer, sheet_name='DuAn_ChiTiet', index=False)
+        load_materials_master().to_excel(writer, sheet_name='KhoVatTu', index=False)
+        for y in get_archived_years("data"): load_data_partition(y).to_excel(writer, sheet_name=f'ThuChi_{y}', index=False)
+        for y in get_archived_years("data_duan"): load_project_partition(y).to_excel(writer, sheet_name=f'DuAn_{y}', index=False)
+        load_checkpoints().to_excel(writer, sheet_name='Checkpoint', index=False)
+    return output.getvalue()
+
+def convert_df_to_excel_custom(df_report, start_date, end_date):
+    output = BytesIO()
+    cfg = load_config()
+    d1_n = cfg.get('debt_1_name', "SAMSUNG S1 HN"); d1_v = float(cfg.get('debt_1_val', -4000000))
+    d2_n = cfg.get('debt_2_name', "TẾT 2025"); d2_v = float(cfg.get('debt_2_val', -5000000))
+
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        wb = writer.book
+        fn = 'Times New Roman'
+        f_title = wb.add_format({'bold': True, 'font_size': 20, 'align': 'center', 'valign': 'vcenter', 'font_name': fn})
+        f_sub = wb.add_format({'font_size': 12, 'align': 'center', 'valign': 'vcenter', 'italic': True, 'font_name': fn})
+        f_sys = wb.add_format({'bold': True, 'font_size': 12, 'align': 'center', 'valign': 'vcenter', 'font_name': fn, 'font_color': '#1e3a8a'})
+        f_head = wb.add_format({'bold': True, 'border': 1, 'align': 'center', 'bg_color': '#D3D3D3', 'font_size': 11, 'font_name': fn})
+        f_cell = wb.add_format({'border': 1, 'valign': 'vcenter', 'font_size': 11, 'font_name': fn})
+        f_num = wb.add_format({'border': 1, 'valign': 'vcenter', 'num_format': '#,##0', 'font_size': 11, 'font_name': fn})
+        f_tot_l = wb.add_format({'bold': True, 'border': 1, 'bg_color': '#FFFF00', 'align': 'center', 'font_size': 12, 'font_name': fn})
+        f_tot_v = wb.add_format({'bold': True, 'border': 1, 'bg_color': '#FFCC00', 'num_format': '#,##0', 'font_size': 12, 'font_name': fn})
+        f_debt_t = wb.add_format({'font_size': 11, 'italic': True, 'align': 'right', 'font_name': fn})
+        f_debt_n = wb.add_format({'font_size': 11, 'italic': True, 'align': 'right', 'font_name': fn, 'num_format': '#,##0', 'font_color': 'red', 'bold': True})
+
+        ws = wb.add_worksheet("SoQuy")
+        ws.merge_range('A1:F1', "QUYẾT TOÁN", f_title)
+        ws.merge_range('A2:F2', f"Từ {start_date.strftime('%d/%m/%Y')} đến {end_date.strftime('%d/%m/%Y')}", f_sub)
+        ws.merge_range('A3:F3', f"Xuất lúc: {get_vn_time().strftime('%H:%M %d/%m/%Y')}", f_sub)
+        ws.merge_range('A4:F4', "HỆ THỐNG QUYẾT TOÁN", f_sys)
+        ws.merge_range('A5:F5', "Người tạo: TUẤN VDS.HCM", f_sub)
+        
+        for c, h in enumerate(["STT", "Khoản", "Ngày chi", "Ngày Nhận", "Số tiền", "Còn lại"]): ws.write(5, c, h, f_head)
+        ws.set_column('B:B', 40); ws.set_column('C:D', 15); ws.set_column('E:F', 18)
+
+        df_c = df_report.reset_index(drop=True)
+        for i, r in df_c.iterrows():
+            ws.write(6+i, 0, r['STT'], f_cell); ws.write(6+i, 1, r['Khoan'], f_cell)
+            ws.write(6+i, 2, r['NgayChi'], f_cell); ws.write(6+i, 3, r['NgayNhan'], f_cell)
+            ws.write(6+i, 4, r['SoTienShow'] if r['Loai']!='Open' else "", f_num); ws.write(6+i, 5, r['ConLai'], f_num)
+            
+        lr = 6 + len(df_c)
+        ws.merge_range(lr, 0, lr, 4, "TỔNG CỘNG", f_tot_l)
+        lb = df_c.iloc[-1]['ConLai'] if not df_c.empty else 0
+        ws.write(lr, 5, lb, f_tot_v)
+        
+        fr = lr + 3 
+        ws.merge_range(fr, 3, fr, 4, d1_n, f_debt_t); ws.write(fr, 5, d1_v, f_debt_n); fr+=1
+        ws.merge_range(fr, 3, fr, 4, d2_n, f_debt_t); ws.write(fr, 5, d2_v, f_debt_n); fr+=1
+        ws.merge_range(fr, 0, fr, 4, "TỔNG TẠM TÍNH", f_tot_l); ws.write(fr, 5, lb + d1_v + d2_v, f_tot_v)
+    return output.getvalue()
+
+def export_project_materials_excel(df_proj, proj_name):
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        wb = writer.book
+        fn = 'Times New Roman'
+        f_title = wb.add_format({'bold': True, 'font_size': 20, 'align': 'center', 'valign': 'vcenter', 'font_name': fn})
+        f_sub = wb.add_format({'font_size': 12, 'align': 'center', 'valign': 'vcenter', 'italic': True, 'font_name': fn})
+        f_sys = wb.add_format({'bold': True, 'font_size': 12, 'align': 'center', 'valign': 'vcenter', 'font_name': fn, 'font_color': '#1e3a8a'})
+        f_head = wb.add_format({'bold': True, 'border': 1, 'align': 'center', 'bg_color': '#D3D3D3', 'font_size': 11, 'font_name': fn})
+        f_cell = wb.add_format({'border': 1, 'valign': 'vcenter', 'font_size': 11, 'font_name': fn})
+        f_num = wb.add_format({'border': 1, 'valign': 'vcenter', 'num_format': '#,##0', 'font_size': 11, 'font_name': fn})
+        f_tot_l = wb.add_format({'bold': True, 'border': 1, 'bg_color': '#FFFF00', 'align': 'center', 'font_size': 12, 'font_name': fn})
+        f_tot_v = wb.add_format({'bold': True, 'border': 1, 'bg_color': '#FFCC00', 'num_format': '#,##0', 'valign': 'vcenter', 'font_name': fn, 'font_size': 12})
+        f_link = wb.add_format({'border': 1, 'valign': 'vcenter', 'font_size': 11, 'font_name': fn, 'font_color': 'blue', 'underline': True})
+        
+        ws = wb.add_worksheet("BangKe")
+        
+        ws.merge_range('A1:I1', "BẢNG KÊ VẬT TƯ", f_title)
+        ws.merge_range('A2:I2', f"Dự án: {proj_name}", f_sub)
+        ws.merge_range('A3:I3', f"Xuất lúc: {get_vn_time().strftime('%H:%M %d/%m/%Y')}", f_sub)
+        ws.merge_range('A4:I4', "HỆ THỐNG QUẢN LÝ VẬT TƯ DỰ ÁN", f_sys)
+        ws.merge_range('A5:I5', "Người tạo: TUẤN VDS.HCM", f_sub)
+        
+        cols = ["STT", "Mã VT", "Tên VT", "ĐVT", "SL", "Đơn giá", "Thành tiền", "Ghi chú", "Link/NCC"]
+        for i, h in enumerate(cols): ws.write(5, i, h, f_head)
+        ws.set_column('B:B', 15); ws.set_column('C:C', 40); ws.set_column('E:G', 15); ws.set_column('H:I', 25)
+        
+        df_c = df_proj.reset_index(drop=True)
+        tot = 0
+        for i, r in df_c.iterrows():
+            ws.write(6+i, 0, i+1, f_cell)
+            ws.write(6+i, 1, str(r.get('MaVT', '')), f_cell)
+            ws.write(6+i, 2, str(r.get('TenVT', '')), f_cell)
+            ws.write(6+i, 3, str(r.get('DVT', '')), f_cell)
+            ws.write(6+i, 4, r.get('SoLuong', 0), f_cell)
+            ws.write(6+i, 5, r.get('DonGia', 0), f_num)
+            ws.write(6+i, 6, r.get('ThanhTien', 0), f_num)
+            ws.write(6+i, 7, str(r.get('GhiChu', '')), f_cell)
+            
+            link_val = str(r.get('LinkNCC', '')).strip()
+            domain = extract_domain(link_val)
+            is_url = link_val.lower().startswith(('http', 'www')) or (domain != link_val and '.' in domain)
+            
+            if is_url:
+                href = link_val if link_val.lower().startswith('http') else 'https://' + link_val
+                ws.write_url(6+i, 8, href, f_link, string=domain)
+            else:
+                ws.write(6+i, 8, link_val, f_cell)
+                
+            tot += r.get('ThanhTien', 0)
+            
+        lr = 6 + len(df_c)
+        ws.merge_range(lr, 0, lr, 5, "TỔNG CỘNG", f_tot_l)
+        ws.write(lr, 6, tot, f_tot_v)
+        ws.write(lr, 7, "", f_tot_l)
+        ws.write(lr, 8, "", f_tot_l)
+    return output.getvalue()
+
+def summarize_project_materials(df_proj):
+    data = df_proj.groupby(['MaVT','TenVT','DVT'], as_index=False).agg({'SoLuong':'sum','ThanhTien':'sum'})
+    data['DonGia'] = data.apply(lambda x: x['ThanhTien']/x['SoLuong'] if x['SoLuong']>0 else 0, axis=1)
+    return data
+
+def process_report_data(df, start_date=None, end_date=None, opening_balance=0):
+    if df.empty: return pd.DataFrame()
+    df_all = df.sort_values(by=['Ngay', 'Row_Index']).copy()
+    df_all['SignedAmount'] = df_all.apply(lambda x: x['SoTien'] if x['Loai'] == 'Thu' else -x['SoTien'], axis=1)
+    df_all['ConLai'] = opening_balance + df_all['SignedAmount'].cumsum()
+    if start_date and end_date:
+        mask_before = df_all['Ngay'].dt.date < start_date
+        ob = df_all[mask_before].iloc[-1]['ConLai'] if not df_all[mask_before].empty else opening_balance
+        df_proc = df_all[(df_all['Ngay'].dt.date >= start_date) & (df_all['Ngay'].dt.date <= end_date)].copy()
+        if not df_proc.empty: df_proc['ConLai'] = ob + df_proc['SignedAmount'].cumsum()
+        df_proc = pd.concat([pd.DataFrame([{'Row_Index': 0, 'Ngay': pd.Timestamp(start_date), 'Loai': 'Open', 'SoTien': 0, 'MoTa': "Số dư đầu kỳ", 'HinhAnh': '', 'ConLai': ob, 'SignedAmount': 0}]), df_proc], ignore_index=True)
+    else: df_proc = df_all.copy()
+    if df_proc.empty: return pd.DataFrame()
+    df_proc['STT'] = range(1, len(df_proc) + 1)
+    df_proc['Khoan'] = df_proc.apply(lambda x: x['MoTa'] if x['Loai'] == 'Open' else auto_capitalize(x['MoTa']), axis=1)
+    def get_date_str(row): return "" if row['Loai'] == 'Open' or pd.isna(row['Ngay']) else row['Ngay'].strftime('%d/%m/%Y')
+    df_proc['NgayChi'] = df_proc.apply(lambda x: get_date_str(x) if x['Loai'] == 'Chi' else "", axis=1)
+    df_proc['NgayNhan'] = df_proc.apply(lambda x: get_date_str(x) if x['Loai'] == 'Thu' else "", axis=1)
+    df_proc['SoTienShow'] = df_proc.apply(lambda x: x['SoTien'] if x['Loai'] != 'Open' else 0, axis=1)
+    return df_proc[['STT', 'Khoan', 'NgayChi', 'NgayNhan', 'SoTienShow', 'ConLai', 'Loai']]
+
+def build_report(start_date, end_date):
+    df_rng, ob = load_ledger_range(start_date, end_date)
+    return process_report_data(df_rng, start_date, end_date, ob)
+
@@ -0,0 +1,88 @@
+# ==================== RUNTIME: CACHE, SECRETS & API CLIENT ====================
+# Khi chạy trong app Streamlit (streamlit đã được import trước), dùng st.cache_data / st.cache_resource / st.secrets
+# như cũ. Khi chạy headless (CLI, cron), dùng cache TTL trong tiến trình và đọc secrets từ file TOML,
+# để không phải trả chi phí import Streamlit. gspread / google-auth chỉ được import khi thực sự gọi API.
+import copy
+import functools
+import os
+import sys
+import threading
+import time
+
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+SPREADSHEET_NAME = "QuanLyThuChi"
+
+_DATA_CACHES = []
+
+def _streamlit(): return sys.modules.get("streamlit")
+
+def _ttl_cache(fn, ttl, copy_result):
+    store, lock = {}, threading.Lock()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        with lock: hit = store.get(key)
+        if hit is None or (ttl is not None and hit[0] < time.monotonic()):
+            hit = (time.monotonic() + ttl if ttl is not None else None, fn(*args, **kwargs))
+            with lock: store[key] = hit
+        return copy.deepcopy(hit[1]) if copy_result else hit[1]
+
+    def clear():
+        with lock: store.clear()
+
+    wrapper.clear = clear
+    return wrapper
+
+def cache_data(ttl=None):
+    """Tương đương st.cache_data: kết quả được trả về dưới dạng bản sao."""
+    def deco(fn):
+        st = _streamlit()
+        wrapped = st.cache_data(ttl=ttl, show_spinner=False)(fn) if st else _ttl_cache(fn, ttl, True)
+        _DATA_CACHES.append(wrapped)
+        return wrapped
+    return deco
+
+def cache_resource(ttl=None):
+    """Tương đương st.cache_resource: đối tượng được dùng chung, không sao chép."""
+    def deco(fn):
+        st = _streamlit()
+        return st.cache_resource(ttl=ttl, show_spinner=False)(fn) if st else _ttl_cache(fn, ttl, False)
+    return deco
+
+def clear_caches():
+    st = _streamlit()
+    if st: st.cache_data.clear()
+    else:
+        for c in _DATA_CACHES: c.clear()
+
+@functools.lru_cache(maxsize=1)
+def _load_secrets_file():
+    path = os.environ.get("ERP_SECRETS", os.path.join(".streamlit", "secrets.toml"))
+    try: import tomllib
+    except ImportError:
+        import toml
+        return toml.load(path)
+    with open(path, "rb") as f: return tomllib.load(f)
+
+def get_secret(key):
+    st = _streamlit()
+    return st.secrets[key] if st else _load_secrets_file()[key]
+
+@cache_resource()
+def get_creds():
+    from google.oauth2.service_account import Credentials
+    return Credentials.from_service_account_info(dict(get_secret("gcp_service_account")), scopes=SCOPES)
+
+@cache_resource()
+def get_gs_client():
+    import gspread
+    from .scheduler import throttled_http_client
+    http_client = throttled_http_client()
+    return gspread.authorize(get_creds(), http_client=http_client) if http_client else gspread.authorize(get_creds())
+
+@cache_resource()
+def get_workbook(): return get_gs_client().open(SPREADSHEET_NAME)
+
+@cache_resource()
+def get_worksheet(name): return get_workbook().worksheet(name)
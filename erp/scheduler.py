@@ -0,0 +1,91 @@
+# ==================== ĐIỀU PHỐI REQUEST GOOGLE SHEETS ====================
+# 1. Mọi request gspread tới sheets.googleapis.com đi qua ThrottledHTTPClient: mỗi request lấy một token từ
+#    bucket đọc (GET) hoặc ghi (còn lại). Mặc định 50 token/phút + burst 10, nên trong bất kỳ cửa sổ 60 giây nào
+#    cũng không vượt quota 60 request/phút/user của Sheets API. Lỗi 429/5xx còn sót lại được BackOffHTTPClient thử lại.
+# 2. coalesce(): gom các lệnh ghi trong một thao tác (vd. lưu form cấu hình) thành 1 request values_batch_update
+#    + 1 append_rows cho mỗi sheet, và gộp các lần xóa cache thành một lần duy nhất khi kết thúc.
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+class TokenBucket:
+    def __init__(self, per_minute, burst):
+        self.rate, self.capacity = per_minute / 60.0, float(burst)
+        self.tokens, self.updated = float(burst), time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1; return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+READ_BUCKET = TokenBucket(int(os.environ.get("ERP_SHEETS_READS_PER_MIN", "50")), int(os.environ.get("ERP_SHEETS_READ_BURST", "10")))
+WRITE_BUCKET = TokenBucket(int(os.environ.get("ERP_SHEETS_WRITES_PER_MIN", "50")), int(os.environ.get("ERP_SHEETS_WRITE_BURST", "10")))
+
+def throttled_http_client():
+    """Lớp HTTP client cho gspread.authorize(..., http_client=...); None nếu bản gspread không hỗ trợ."""
+    try: from gspread.http_client import BackOffHTTPClient
+    except ImportError: return None
+
+    class ThrottledHTTPClient(BackOffHTTPClient):
+        def request(self, method, endpoint, *args, **kwargs):
+            if "sheets.googleapis.com" in str(endpoint): (READ_BUCKET if str(method).upper() == "GET" else WRITE_BUCKET).acquire()
+            return super().request(method, endpoint, *args, **kwargs)
+
+    return ThrottledHTTPClient
+
+# --- GOM LỆNH GHI ---
+_local = threading.local()
+
+class WriteBatch:
+    def __init__(self):
+        self.cells, self.appends, self.callbacks, self.memos = [], {}, [], {}
+
+    def update_cells(self, sheet_name, cells): self.cells += [(sheet_name, int(r), int(c), v) for r, c, v in cells]
+    def append_rows(self, sheet_name, rows): self.appends.setdefault(sheet_name, []).extend(rows)
+    def defer(self, fn):
+        if fn not in self.callbacks: self.callbacks.append(fn)
+    def memo(self, key, fn):
+        """Kết quả đọc dùng chung trong cả lô (vd. cột Key của config), chỉ gọi API lần đầu."""
+        if key not in self.memos: self.memos[key] = fn()
+        return self.memos[key]
+
+    def flush(self, get_worksheet, get_workbook):
+        """Gửi lô ghi; callback (xóa cache) luôn chạy, kể cả khi một request lỗi giữa chừng sau khi đã ghi một phần."""
+        try:
+            if self.cells:
+                from gspread.utils import rowcol_to_a1
+                data = [{'range': f"'{s}'!{rowcol_to_a1(r, c)}", 'values': [[v]]} for s, r, c, v in self.cells]
+                get_workbook().values_batch_update({'valueInputOption': 'USER_ENTERED', 'data': data})
+            for sheet_name, rows in self.appends.items(): get_worksheet(sheet_name).append_rows(rows)
+        finally:
+            for fn in self.callbacks: fn()
+
+@contextmanager
+def coalesce():
+    """Gom mọi lệnh ghi / xóa cache bên trong khối lệnh; lồng nhau thì dùng chung lô ngoài cùng.
+    Khối lệnh lỗi thì bỏ các lệnh ghi chưa gửi nhưng vẫn chạy callback. Lỗi khi gửi lô được ném ra tại cuối khối ngoài cùng."""
+    outer = getattr(_local, "batch", None)
+    if outer is not None:
+        yield outer; return
+    from .runtime import get_workbook, get_worksheet
+    batch = _local.batch = WriteBatch()
+    try: yield batch
+    except BaseException:
+        batch.cells, batch.appends = [], {}; raise
+    finally:
+        _local.batch = None
+        batch.flush(get_worksheet, get_workbook)
+
+def defer(fn):
+    """Chạy fn khi lô ghi hiện tại kết thúc (gộp trùng), hoặc chạy ngay nếu không có lô nào."""
+    batch = getattr(_local, "batch", None)
+    if batch is None: fn()
+    else: batch.defer(fn)
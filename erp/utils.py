@@ -0,0 +1,63 @@
+# ==================== HELPER ====================
+import random
+import re
+import string
+import unicodedata
+from datetime import datetime
+from urllib.parse import urlparse
+
+import pandas as pd
+import pytz
+
+def get_vn_time(): return datetime.now(pytz.timezone('Asia/Ho_Chi_Minh'))
+def remove_accents(input_str):
+    if not isinstance(input_str, str): return str(input_str)
+    s = unicodedata.normalize('NFD', input_str)
+    return "".join([c for c in s if unicodedata.category(c) != 'Mn']).replace("đ", "d").replace("Đ", "D")
+
+def auto_capitalize(text):
+    if not text or not str(text).strip(): return ""
+    text = str(text).strip()
+    if text.lower().startswith(("http", "www")): return text
+    return text[0].upper() + text[1:]
+
+def format_vnd(amount):
+    if pd.isna(amount): return "0"
+    try:
+        val = float(amount)
+        if val.is_integer(): return "{:,.0f}".format(val).replace(",", ".")
+        return "{:,.2f}".format(val).replace(",", "X").replace(".", ",").replace("X", ".").rstrip('0').rstrip(',')
+    except: return "0"
+
+def generate_project_code(name): return f"{''.join([w[0] for w in remove_accents(name).upper().split() if w.isalnum()])}{get_vn_time().strftime('%d%m%y')}" if name else ""
+def generate_material_code(name): return f"VT{''.join([w[0] for w in remove_accents(name).upper().split() if w.isalnum()])[:3]}{''.join(random.choices(string.digits, k=3))}"
+
+def extract_domain(url):
+    url_str = str(url).strip()
+    if not url_str: return ""
+    if not url_str.lower().startswith(('http://', 'https://')):
+        if 'www.' in url_str.lower() or ('.' in url_str and '/' in url_str):
+            url_str = 'https://' + url_str
+        else:
+            return url_str 
+    try:
+        domain = urlparse(url_str).netloc
+        return domain.replace('www.', '') if domain else url_str
+    except:
+        return url_str
+
+def clean_note_and_link(note, link):
+    n = str(note).strip()
+    l = str(link).strip()
+    urls_in_note = re.findall(r'(https?://\S+|www\.\S+)', n, flags=re.IGNORECASE)
+    
+    if urls_in_note:
+        first_url = urls_in_note[0]
+        if not l:  
+            l = first_url
+            n = n.replace(first_url, '').strip()
+        elif first_url in l or l in first_url: 
+            n = n.replace(first_url, '').strip()
+            
+    n = re.sub(r'^[\s,\-\|]+|[\s,\-\|]+$', '', n)
+    return auto_capitalize(n), l